@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination
+
+from posts.paginators import NEWER, OLDER, POSTS_PER_PAGE
+from posts.timelines import read_time_authors, timeline_filter
+
+
+class PostPagination(CursorPagination):
+    page_size = POSTS_PER_PAGE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = '-pub_date'
+
+
+class CommentPagination(PostPagination):
+    ordering = 'created'
+
+
+class GroupPagination(PostPagination):
+    ordering = 'slug'
+
+
+class TimelinePagination(PostPagination):
+    """Лента подписок: строки страницы выбираются из источников ленты за
+    позицией курсора (см. posts.timelines.timeline_filter), а не из
+    объединения всех записей ленты."""
+    ordering = ('-pub_date', '-pk')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        offset, reverse, position = cursor or (0, False, None)
+        queryset = queryset.filter(timeline_filter(
+            request.user, read_time_authors(request.user),
+            offset + page_size + 1, NEWER if reverse else OLDER, position,
+        ))
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,53 @@
+from rest_framework import serializers
+
+from posts.models import Comment, Group, Post
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе только поля из параметра ?fields=id,text."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = requested_fields(request)
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    if request is None or not request.query_params.get('fields'):
+        return set()
+    return {
+        name.strip() for name in request.query_params['fields'].split(',')
+    }
+
+
+class GroupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Group
+        fields = ('id', 'title', 'slug', 'description')
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.SlugRelatedField(
+        slug_field='username', read_only=True)
+    group = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    thumbnail = serializers.ImageField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Post
+        fields = (
+            'id', 'text', 'pub_date', 'updated', 'author', 'group',
+            'image', 'thumbnail', 'image_processing', 'comment_count',
+        )
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.SlugRelatedField(
+        slug_field='username', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'post', 'parent', 'author', 'text', 'created')
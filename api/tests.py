@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+class TestReadApi(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ripley')
+        self.author = User.objects.create_user(username='bishop')
+        self.group = Group.objects.create(
+            title='Чужие', slug='aliens', description='Ксеноморфы')
+        self.posts = [
+            Post.objects.create(
+                author=self.author, text=f'Пост {i}', group=self.group)
+            for i in range(15)
+        ]
+
+    def test_posts_cursor_pagination(self):
+        response = self.client.get(reverse('api:posts-list'))
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertEqual(first['results'][0]['text'], 'Пост 14')
+        self.assertEqual(first['results'][0]['author'], 'bishop')
+        self.assertEqual(first['results'][0]['group'], 'aliens')
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [post['text'] for post in second['results']],
+            [f'Пост {i}' for i in range(4, -1, -1)],
+        )
+        self.assertIsNone(second['next'])
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(
+            reverse('api:posts-list'), {'fields': 'id,text'})
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'text'})
+        with self.assertNumQueries(1):
+            self.client.get(
+                reverse('api:posts-list'), {'fields': 'id,text'})
+
+    def test_etag_revalidation(self):
+        url = reverse('api:posts-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_comments_and_groups(self):
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Комментарий')
+        response = self.client.get(reverse(
+            'api:comments-list', kwargs={'post_id': self.posts[0].pk}))
+        self.assertEqual(response.json()['results'][0]['author'], 'ripley')
+        response = self.client.get(
+            reverse('api:groups-detail', kwargs={'slug': 'aliens'}))
+        self.assertEqual(response.json()['title'], 'Чужие')
+
+    def test_follow_feed_requires_token(self):
+        url = reverse('api:follow-list')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        Follow.objects.create(user=self.user, author=self.author)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['results']), 10)
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_follow_feed_merges_read_time_authors(self):
+        popular = User.objects.create_user(username='ash')
+        AuthorStats.objects.filter(user=popular).update(fanout_on_read=True)
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=popular)
+        Post.objects.create(author=popular, text='Популярный пост')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        first = self.client.get(reverse('api:follow-list')).json()
+        second = self.client.get(first['next']).json()
+        texts = [post['text'] for post in first['results'] + second['results']]
+        self.assertEqual(
+            texts,
+            ['Популярный пост'] + [f'Пост {i}' for i in range(14, -1, -1)],
+        )
+        previous = self.client.get(second['previous']).json()
+        self.assertEqual(previous['results'], first['results'])
@@ -0,0 +1,148 @@
+import hashlib
+import json
+
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import permissions, status, viewsets
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from posts.feed_cache import get_versions
+from posts.models import Comment, Group, Post
+
+from .pagination import (CommentPagination, GroupPagination, PostPagination,
+                         TimelinePagination)
+from .serializers import (CommentSerializer, GroupSerializer, PostSerializer,
+                          requested_fields)
+
+
+class ConditionalMixin:
+    """ETag и ответ 304 на If-None-Match.
+
+    Если get_etag_scopes() возвращает области ленты, ETag строится из их
+    версий (см. posts.feed_cache) и проверяется до запроса к базе.
+    Иначе ETag - хэш данных ответа: это экономит трафик, но не запросы.
+    """
+
+    def get_etag_scopes(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        scopes = self.get_etag_scopes()
+        if scopes is not None:
+            etag = make_etag(
+                get_versions(scopes), request.get_full_path())
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response = handler(request, *args, **kwargs)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag = make_etag(json.dumps(response.data, cls=JSONEncoder))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or etag in etags
+
+
+def not_modified(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={
+        'ETag': etag,
+    })
+
+
+class ReadOnlyViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = (JSONRenderer,)
+
+
+class PostViewSet(ReadOnlyViewSet):
+    """Посты в порядке ленты; фильтры ?group=<slug> и ?author=<username>."""
+    serializer_class = PostSerializer
+    pagination_class = PostPagination
+
+    def get_queryset(self):
+        fields = requested_fields(self.request)
+        if not fields or 'comment_count' in fields:
+            posts = Post.objects.feed()
+        else:
+            # Без числа комментариев не нужен и подзапрос к ним.
+            posts = Post.objects.select_related('group', 'author')
+        group = self.request.query_params.get('group')
+        if group:
+            posts = posts.filter(group__slug=group)
+        author = self.request.query_params.get('author')
+        if author:
+            posts = posts.filter(author__username=author)
+        return posts
+
+    def get_etag_scopes(self):
+        params = self.request.query_params
+        if self.action != 'list':
+            return ['index']
+        if params.get('author'):
+            return [f'author:{params["author"]}']
+        if params.get('group'):
+            return [f'group:{params["group"]}']
+        return ['index']
+
+
+class CommentViewSet(ReadOnlyViewSet):
+    serializer_class = CommentSerializer
+    pagination_class = CommentPagination
+
+    def get_queryset(self):
+        post = get_object_or_404(Post, pk=self.kwargs['post_id'])
+        return Comment.objects.filter(post=post).select_related('author')
+
+    def get_etag_scopes(self):
+        # Изменение комментария меняет версию всех лент поста.
+        return ['index']
+
+
+class GroupViewSet(ReadOnlyViewSet):
+    serializer_class = GroupSerializer
+    pagination_class = GroupPagination
+    queryset = Group.objects.all()
+    lookup_field = 'slug'
+
+    def get_etag_scopes(self):
+        return ['groups']
+
+
+class FollowViewSet(ReadOnlyViewSet):
+    """Лента подписок текущего пользователя. Версий у неё нет, поэтому
+    ETag считается по содержимому страницы. Записи ленты отбирает
+    TimelinePagination, по ключу курсора."""
+    serializer_class = PostSerializer
+    pagination_class = TimelinePagination
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return Post.objects.feed()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post
+from .models import AuthorStats, Comment, Follow, Group, Job, Post
+from .search import text_matches
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +17,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%...%' по всей таблице - полнотекстовый индекс.
+        if not search_term.strip():
+            return queryset, False
+        matches = text_matches(search_term)
+        if matches is None:
+            return queryset.none(), False
+        return queryset.filter(pk__in=matches), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -49,7 +59,33 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ('author', 'user',)
 
 
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'posts_count',
+        'followers_count',
+        'following_count',
+    )
+    search_fields = ('user__username',)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'kind',
+        'status',
+        'attempts',
+        'run_after',
+        'locked_by',
+        'finished',
+    )
+    list_filter = ('status', 'kind')
+    empty_value_display = '-пусто-'
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,188 @@
+"""Замеры страниц posts/urls.py и сравнение результатов между прогонами.
+
+Результат прогона - JSON: время, коммит, размер данных и для каждой
+страницы перцентили задержки и число запросов к базе. Два таких файла
+сравниваются функцией compare.
+"""
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+from collections import namedtuple
+from contextlib import closing, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count
+from django.urls import reverse
+
+from . import seeding, urls
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+Case = namedtuple('Case', 'name method url data user')
+
+PERCENTILES = (50, 90, 99)
+# Рост задержки больше этой доли или любой рост числа запросов -
+# регрессия.
+LATENCY_THRESHOLD = 0.2
+
+
+class NoData(Exception):
+    pass
+
+
+def url_names():
+    return [pattern.name for pattern in urls.urlpatterns]
+
+
+def sample_objects():
+    """Самый читаемый автор, самый активный читатель, самая
+    обсуждаемая запись автора и самое наполненное сообщество."""
+    top = AuthorStats.objects.order_by('-followers_count', 'pk').first()
+    author = top.user if top else None
+    if author is None or not author.posts.exists():
+        post = Post.objects.order_by('-pk').first()
+        if post is None:
+            raise NoData
+        author = post.author
+    reader_stats = AuthorStats.objects.exclude(user=author).order_by(
+        '-following_count', 'pk').first()
+    reader = (
+        reader_stats.user if reader_stats
+        else User.objects.exclude(pk=author.pk).first()
+    ) or author
+    post = author.posts.annotate(
+        comment_total=Count('comments')).order_by('-comment_total').first()
+    group = Group.objects.annotate(
+        post_total=Count('posts')).order_by('-post_total').first()
+    return author, reader, post, group
+
+
+def cases():
+    author, reader, post, group = sample_objects()
+    post_kwargs = {'username': author.username, 'post_id': post.pk}
+    text = {'text': seeding.make_text(random.Random(1), 30)}
+    found = [
+        Case('index', 'get', reverse('index'), None, None),
+        Case('new_post', 'get', reverse('new_post'), None, reader),
+        Case('new_post', 'post', reverse('new_post'), text, reader),
+        Case('follow_index', 'get', reverse('follow_index'), None, reader),
+        Case('search', 'get', reverse('search'),
+             {'q': seeding.BASES[0] + 'и'}, None),
+        Case('profile', 'get', reverse('profile', args=[author.username]),
+             None, None),
+        Case('post', 'get', reverse('post', kwargs=post_kwargs), None, None),
+        Case('post_comments', 'get',
+             reverse('post_comments', kwargs=post_kwargs), None, None),
+        Case('post_edit', 'get', reverse('post_edit', kwargs=post_kwargs),
+             None, author),
+        Case('add_comment', 'post',
+             reverse('add_comment', kwargs=post_kwargs), text, reader),
+        Case('profile_follow', 'get',
+             reverse('profile_follow', args=[author.username]), None, reader),
+        Case('profile_unfollow', 'get',
+             reverse('profile_unfollow', args=[author.username]),
+             None, reader),
+    ]
+    if group is not None:
+        found.insert(1, Case(
+            'group', 'get', reverse('group', args=[group.slug]), None, None))
+    return found
+
+
+def case_key(case):
+    if case.method == 'get':
+        return case.name
+    return f'{case.name} {case.method.upper()}'
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу, values отсортированы."""
+    return values[max(0, math.ceil(share / 100 * len(values)) - 1)]
+
+
+def summarize(latencies, queries, status):
+    latencies = sorted(latencies)
+    summary = {
+        f'p{share}': round(percentile(latencies, share), 3)
+        for share in PERCENTILES
+    }
+    summary['mean'] = round(sum(latencies) / len(latencies), 3)
+    summary['max'] = round(latencies[-1], 3)
+    summary['queries'] = sorted(queries)[len(queries) // 2]
+    summary['status'] = status
+    return summary
+
+
+def dataset():
+    return {
+        model._meta.model_name: model.objects.count()
+        for model in (User, Group, Post, Comment, Follow)
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def save(result, path=None):
+    if path is None:
+        os.makedirs(settings.BENCHMARK_DIR, exist_ok=True)
+        stamp = result['created'].replace(':', '').replace('-', '')[:15]
+        path = os.path.join(settings.BENCHMARK_DIR, f'views-{stamp}.json')
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(result, output, ensure_ascii=False, indent=2)
+    return path
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def compare(baseline, current, threshold=LATENCY_THRESHOLD):
+    """(страница, p50 было, p50 стало, запросов было, стало,
+    регрессия ли) для страниц, замеренных в обоих прогонах."""
+    rows = []
+    for name, now in current['views'].items():
+        before = baseline['views'].get(name)
+        if before is None:
+            continue
+        slower = now['p50'] > before['p50'] * (1 + threshold)
+        rows.append((
+            name, before['p50'], now['p50'], before['queries'],
+            now['queries'], slower or now['queries'] > before['queries'],
+        ))
+    return rows
+
+
+def copy_database(source, target):
+    # Режим журнала хранится в файле: копия начинает с журнала отката.
+    with closing(sqlite3.connect(source)) as origin, \
+            closing(sqlite3.connect(target)) as copy:
+        origin.backup(copy)
+        copy.execute('PRAGMA journal_mode = DELETE')
+
+
+@contextmanager
+def swap_database(path):
+    """Основная база - файл path для всех потоков: соединения,
+    открытые внутри, читают и пишут копию."""
+    settings_dict = connections.databases[DEFAULT_DB_ALIAS]
+    original = settings_dict['NAME']
+    connection.close()
+    settings_dict['NAME'] = path
+    try:
+        yield
+    finally:
+        connection.close()
+        settings_dict['NAME'] = original
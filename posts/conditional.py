@@ -0,0 +1,71 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .feed_cache import changed_at, get_versions
+
+
+def feed_validators(request, *scopes):
+    """ETag и время изменения страницы по версиям областей ленты.
+
+    Сигналы меняют версию области при любой записи, которая видна на
+    её страницах, а версии лежат в кэше: валидаторы не стоят ни одного
+    запроса к базе.
+    """
+    versions = get_versions(scopes)
+    last_modified = datetime.fromtimestamp(
+        max(map(changed_at, versions)), tz=timezone.utc)
+    # В шапке страницы имя пользователя, поэтому ETag у каждого свой.
+    digest = hashlib.md5(repr((
+        request.user.pk,
+        request.get_full_path(),
+        versions,
+    )).encode()).hexdigest()
+    return quote_etag(digest), last_modified
+
+
+def conditional_page(validators):
+    """Отвечает 304, если ETag или Last-Modified из validators(request,
+    **kwargs) совпали с присланными, не выполняя вью и не рендеря шаблон.
+
+    Валидаторы считаются только для условных запросов и для страниц,
+    которые рендерятся заново: страница из кэша лент уже несёт свои
+    заголовки, и на них отвечает ConditionalGetMiddleware.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag = last_modified = None
+            if ('HTTP_IF_NONE_MATCH' in request.META
+                    or 'HTTP_IF_MODIFIED_SINCE' in request.META):
+                etag, last_modified = validators(request, **kwargs)
+                response = get_conditional_response(
+                    request,
+                    etag=etag,
+                    last_modified=timestamp(last_modified),
+                )
+                if response is not None:
+                    patch_vary_headers(response, ('Cookie',))
+                    return response
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                if etag is None:
+                    etag, last_modified = validators(request, **kwargs)
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(
+                        timestamp(last_modified))
+                patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def timestamp(value):
+    return int(value.timestamp()) if value is not None else None
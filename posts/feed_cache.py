@@ -0,0 +1,158 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (get_cache_key, has_vary_header,
+                                learn_cache_key, patch_vary_headers)
+
+from yatube import replicas
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+def version_key(scope):
+    return f'feed.version.{scope}'
+
+
+def new_version():
+    # Время смены версии нужно, чтобы не собирать страницу из копии
+    # базы, снятой раньше.
+    return f'{time.time():.6f}-{uuid.uuid4().hex}'
+
+
+def changed_at(version):
+    moment, _, _ = version.partition('-')
+    try:
+        return float(moment)
+    except ValueError:
+        # Версия без времени: когда она сменилась, неизвестно.
+        return time.time()
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = new_version()
+            cache.add(key, version, None)
+            # Кэш, который ничего не хранит (DummyCache), вернёт None:
+            # тогда страница просто не найдётся по ключу.
+            versions[key] = cache.get(key) or version
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Меняет версии scopes, когда изменения зафиксированы. До фиксации
+    другой запрос ещё читает старые строки и закэшировал бы их под новой
+    версией, а копия базы со старыми строками прошла бы проверку по её
+    времени. Вне транзакции версии меняются сразу."""
+    scopes = set(scopes)
+    transaction.on_commit(lambda: cache.set_many(
+        {version_key(scope): new_version() for scope in scopes},
+        None,
+    ))
+
+
+def require_versions(versions):
+    """Не собирать страницу из копии базы, снятой раньше последней смены
+    этих версий."""
+    replicas.require(max(map(changed_at, versions)))
+
+
+def fresh_feed(*scopes):
+    """Для страниц, которые читают из копии базы, но не лежат в кэше
+    лент: копия должна быть не старше версий scopes, шаблонов как у
+    cache_feed. Иначе новый пост другого автора не нашёлся бы до
+    следующего снимка."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            require_versions(get_versions(
+                [scope.format(**kwargs) for scope in scopes]))
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wait_for(request, prefix, lock, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        key = get_cache_key(request, prefix, 'GET', cache=cache)
+        response = cache.get(key) if key else None
+        if response is not None or not cache.has_key(lock):
+            return response
+    return None
+
+
+def cache_feed(*scopes):
+    """Кэширует страницу ленты до изменения её содержимого.
+
+    scopes - шаблоны областей ленты, например 'group:{slug}',
+    подставляются из аргументов вью. Сигналы на Post, Comment и Follow
+    меняют версию области, и закэшированные страницы перестают
+    находиться по ключу. Пока один процесс считает холодную страницу,
+    остальные ждут его результат, а не считают её параллельно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = get_versions(
+                [scope.format(**kwargs) for scope in scopes])
+            require_versions(versions)
+            prefix = 'feed.' + '.'.join(versions)
+            key = get_cache_key(request, prefix, 'GET', cache=cache)
+            response = cache.get(key) if key else None
+            if response is not None:
+                return response
+            lock = 'feed.lock.' + hashlib.md5('|'.join((
+                prefix,
+                request.get_full_path(),
+                request.META.get('HTTP_COOKIE', ''),
+            )).encode()).hexdigest()
+            lock_timeout = settings.FEED_CACHE_LOCK_TIMEOUT
+            locked = cache.add(lock, True, lock_timeout)
+            if not locked:
+                response = wait_for(request, prefix, lock, lock_timeout)
+                if response is not None:
+                    return response
+            try:
+                response = view(request, *args, **kwargs)
+                # Страница содержит имя пользователя в шапке, поэтому
+                # у каждой сессии своя копия, а анонимы делят одну.
+                patch_vary_headers(response, ('Cookie',))
+                if is_cacheable(request, response):
+                    timeout = settings.FEED_CACHE_TIMEOUT
+                    key = learn_cache_key(
+                        request, response, timeout, prefix, cache=cache)
+                    cache.set(key, response, timeout)
+            finally:
+                if locked:
+                    cache.delete(lock)
+            return response
+        return wrapper
+    return decorator
+
+
+def is_cacheable(request, response):
+    if response.streaming or response.status_code != 200:
+        return False
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def post_scopes(post, group_slugs=()):
+    scopes = ['index', f'author:{post.author.username}']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group.slug}')
+    scopes.extend(f'group:{slug}' for slug in group_slugs if slug)
+    return scopes
@@ -0,0 +1,60 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Post
+from .thumbnails import generate_thumbnail
+from .variants import generate_variants
+
+JPEG_QUALITY = 85
+
+
+def recompress(image_file):
+    """Возвращает (расширение, байты) картинки без EXIF, повёрнутой
+    по ориентации из EXIF и пережатой. Для GIF возвращает None:
+    пережатие потеряло бы анимацию."""
+    with Image.open(image_file) as image:
+        if image.format == 'GIF':
+            return None
+        image = ImageOps.exif_transpose(image)
+        image.info.pop('exif', None)
+        buffer = io.BytesIO()
+        has_alpha = image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info)
+        if has_alpha:
+            image.save(buffer, 'PNG', optimize=True)
+            return 'png', buffer.getvalue()
+        image.convert('RGB').save(
+            buffer, 'JPEG',
+            quality=JPEG_QUALITY, optimize=True, progressive=True,
+        )
+        return 'jpg', buffer.getvalue()
+
+
+def process_post_image(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    result = recompress(post.image)
+    if result is not None:
+        extension, data = result
+        # Старый файл освобождает сигнал после сохранения поста.
+        stem = os.path.splitext(os.path.basename(post.image.name))[0]
+        post.image.save(f'{stem}.{extension}', ContentFile(data), save=False)
+    post.image_processing = False
+    post.save(update_fields=['image', 'image_processing', 'updated'])
+    generate_thumbnail(post)
+    generate_variants(post)
+
+
+def post_image_failed(post_id):
+    # Картинку обработать не удалось: показываем оригинал вместо заглушки.
+    # save(), а не update(): новое Post.updated сбрасывает карточку, а
+    # сигналы - закэшированные ленты.
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    post.image_processing = False
+    post.save(update_fields=['image_processing', 'updated'])
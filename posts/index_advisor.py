@@ -0,0 +1,143 @@
+"""Разбор планов запросов страниц из posts.benchmarks.
+
+Каждый уникальный запрос (по отпечатку SQL) проходит через
+EXPLAIN QUERY PLAN. Полный просмотр таблицы и сортировка во временном
+B-дереве отмечаются, и для таблицы предлагается составной индекс:
+сначала столбцы из условий равенства, затем столбцы сортировки.
+
+Условие OR по разным индексам SQLite выполняет как MULTI-INDEX OR:
+каждая ветвь читается своим индексом, а сортируется их объединение.
+Составной индекс эту сортировку не уберёт - её делают дешёвой LIMIT
+в каждой ветви, как в posts.timelines.timeline_filter.
+"""
+import re
+from collections import namedtuple
+
+from django.db import DatabaseError, connection, transaction
+from django.test import Client
+
+from yatube.slow_queries import explain, fingerprint
+
+Query = namedtuple('Query', 'sql params views')
+Finding = namedtuple('Finding', 'query plan issues suggestion')
+
+FULL_SCAN = re.compile(r'\bSCAN (\w+)\b(?! VIRTUAL TABLE| USING)')
+# Подзапросы, которые SQLite выполняет как сопрограмму или
+# материализует; их просмотр - не просмотр таблицы.
+SUBQUERY = re.compile(r'\b(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+MULTI_INDEX_OR = 'MULTI-INDEX OR'
+EQUALS = re.compile(r'"(\w+)"\."(\w+)" (?:= |IN \()')
+ORDER_BY = re.compile(r'ORDER BY (.+?)(?: LIMIT| OFFSET|$)')
+COLUMN = re.compile(r'"(\w+)"\."(\w+)"')
+FROM = re.compile(r'FROM "(\w+)"')
+MIN_ROWS = 1000
+
+
+class Collector:
+    """execute_wrapper, запоминающий запросы и вью, из которых они
+    выполнены."""
+
+    def __init__(self):
+        self.queries = {}
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            key = fingerprint(sql)
+            query = self.queries.get(key)
+            if query is None:
+                query = self.queries[key] = Query(sql, params, set())
+            query.views.add(self.view)
+        return execute(sql, params, many, context)
+
+
+def replay(cases):
+    """Проходит страницы один раз и возвращает их запросы."""
+    collector = Collector()
+    with connection.execute_wrapper(collector):
+        for case in cases:
+            client = Client()
+            if case.user is not None:
+                client.force_login(case.user)
+            collector.view = case.name
+            getattr(client, case.method)(case.url, case.data)
+    return list(collector.queries.values())
+
+
+def table_rows(table):
+    """Число строк таблицы; для псевдонима вроде U0 - None."""
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+
+
+def issues(plan, min_rows=MIN_ROWS):
+    """Полные просмотры таблиц от min_rows строк и сортировки во
+    временном B-дереве."""
+    subqueries = {
+        name for line in plan for name in SUBQUERY.findall(line)}
+    found = []
+    for line in plan:
+        match = FULL_SCAN.search(line)
+        if match and match.group(1) not in subqueries:
+            rows = table_rows(match.group(1))
+            if rows is None or rows >= min_rows:
+                found.append(f'полный просмотр {match.group(1)}')
+        match = TEMP_SORT.search(line)
+        if match and is_multi_index_or(plan):
+            found.append(f'временное B-дерево для {match.group(1)} '
+                         f'объединения ветвей {MULTI_INDEX_OR}')
+        elif match:
+            found.append(f'временное B-дерево для {match.group(1)}')
+    return found
+
+
+def is_multi_index_or(plan):
+    return any(MULTI_INDEX_OR in line for line in plan)
+
+
+def suggest(sql):
+    """Составной индекс для основной таблицы запроса: столбцы условий
+    равенства, затем столбцы ORDER BY. None, если предложить нечего."""
+    table = FROM.search(sql)
+    if table is None:
+        return None
+    table = table.group(1)
+    where = sql.split(' WHERE ', 1)[1] if ' WHERE ' in sql else ''
+    where = ORDER_BY.split(where)[0]
+    columns = []
+    for owner, column in EQUALS.findall(where):
+        # Поиск по первичному ключу индексировать незачем.
+        if owner == table and column != 'id' and column not in columns:
+            columns.append(column)
+    order = ORDER_BY.search(sql)
+    if order:
+        for owner, column in COLUMN.findall(order.group(1)):
+            if owner != table:
+                # Сортировка по чужой таблице индексом не решается.
+                break
+            if column not in columns:
+                columns.append(column)
+    if not columns:
+        return None
+    return f'{table} ({", ".join(columns)})'
+
+
+def analyze(queries, min_rows=MIN_ROWS):
+    findings = []
+    for query in queries:
+        plan = explain(connection, query.sql, query.params)
+        if not plan:
+            continue
+        found = issues(plan, min_rows)
+        if found:
+            suggestion = None
+            if not is_multi_index_or(plan):
+                suggestion = suggest(query.sql)
+            findings.append(Finding(query, plan, found, suggestion))
+    return findings
@@ -0,0 +1,81 @@
+import json
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+HANDLERS = {
+    'process_post_image': 'posts.images.process_post_image',
+    'collect_media': 'posts.media_gc.collect_source',
+}
+
+# Вызываются, когда задача исчерпала все попытки.
+FAILURE_HANDLERS = {
+    'process_post_image': 'posts.images.post_image_failed',
+}
+
+
+def enqueue(kind, **payload):
+    if kind not in HANDLERS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}')
+    return Job.objects.create(kind=kind, payload=json.dumps(payload))
+
+
+def claimable():
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    # Задачи, взятые упавшим обработчиком, возвращаются в работу
+    # по истечении JOB_LOCK_TIMEOUT.
+    return Job.objects.filter(
+        Q(status=Job.PENDING, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=stale)
+    )
+
+
+def claim(worker, limit):
+    candidates = list(claimable().order_by('run_after', 'pk').values_list(
+        'pk', flat=True)[:limit])
+    claimed = []
+    for pk in candidates:
+        updated = claimable().filter(pk=pk).update(
+            status=Job.RUNNING,
+            locked_at=timezone.now(),
+            locked_by=worker,
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(pk)
+    return claimed
+
+
+def run_job(pk):
+    job = Job.objects.get(pk=pk)
+    try:
+        handler = import_string(HANDLERS[job.kind])
+        handler(**json.loads(job.payload))
+    except Exception:
+        fail_job(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=pk).update(
+        status=Job.DONE, finished=timezone.now(), last_error='')
+    return True
+
+
+def fail_job(job, error):
+    if job.attempts < job.max_attempts:
+        delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.PENDING,
+            run_after=timezone.now() + timedelta(seconds=delay),
+            last_error=error,
+        )
+        return
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.FAILED, finished=timezone.now(), last_error=error)
+    if job.kind in FAILURE_HANDLERS:
+        import_string(FAILURE_HANDLERS[job.kind])(**json.loads(job.payload))
@@ -0,0 +1,315 @@
+"""Потоковый экспорт и импорт сообществ, постов, комментариев и подписок
+в JSONL: одна запись на строку, {"type": ..., остальные поля}.
+
+Пользователи и сообщества задаются username и slug, у постов и
+комментариев сохраняются первичные ключи. Ни экспорт, ни импорт не
+держат в памяти больше одной пачки записей.
+"""
+import json
+from collections import Counter
+from itertools import groupby, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils.dateparse import parse_datetime
+
+from .feed_cache import bump
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .storage import media_storage
+from .threads import fill_paths
+from .timelines import backfill_timelines, fan_out_posts
+
+BATCH_SIZE = 1000
+# Строк в одном UPDATE дат: по два параметра на строку и поле.
+DATES_BATCH_SIZE = 500
+# Порядок важен: посты ссылаются на сообщества, комментарии - на посты.
+TYPES = ('group', 'post', 'comment', 'follow')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def export_rows(batch_size=BATCH_SIZE):
+    groups = Group.objects.order_by('pk').values(
+        'slug', 'title', 'description')
+    for row in groups.iterator(chunk_size=batch_size):
+        yield {'type': 'group', **row}
+    posts = Post.objects.order_by('pk').values_list(
+        'pk', 'author__username', 'group__slug', 'text', 'pub_date',
+        'updated', 'image',
+    )
+    for pk, author, group, text, pub_date, updated, image in posts.iterator(
+            chunk_size=batch_size):
+        yield {
+            'type': 'post', 'id': pk, 'author': author, 'group': group,
+            'text': text, 'pub_date': pub_date, 'updated': updated,
+            'image': image or '',
+        }
+    comments = Comment.objects.order_by('pk').values_list(
+        'pk', 'post_id', 'author__username', 'text', 'created', 'parent_id',
+        'path',
+    )
+    for pk, post, author, text, created, parent, path in comments.iterator(
+            chunk_size=batch_size):
+        yield {
+            'type': 'comment', 'id': pk, 'post': post, 'author': author,
+            'text': text, 'created': created, 'parent': parent, 'path': path,
+        }
+    follows = Follow.objects.order_by('pk').values_list(
+        'user__username', 'author__username')
+    for user, author in follows.iterator(chunk_size=batch_size):
+        yield {'type': 'follow', 'user': user, 'author': author}
+
+
+def dump_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def parse_lines(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            raise InvalidRecord(f'Строка {number}: {error}')
+        if record.get('type') not in TYPES:
+            raise InvalidRecord(
+                f'Строка {number}: неизвестный тип {record.get("type")!r}')
+        yield record
+
+
+def batches(records, batch_size=BATCH_SIZE):
+    """Подряд идущие записи одного типа пачками не больше batch_size."""
+    for kind, group in groupby(records, key=lambda record: record['type']):
+        while True:
+            batch = list(islice(group, batch_size))
+            if not batch:
+                break
+            yield kind, batch
+
+
+def date_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+
+
+def bulk_create_dated(model, objects, **kwargs):
+    """bulk_create, сохраняющий даты auto_now/auto_now_add из объектов.
+
+    bulk_create ставит в эти поля текущее время, поэтому даты объектов
+    записываются следом через UPDATE с CASE по pk, не больше
+    DATES_BATCH_SIZE строк за раз; pk у объектов должны быть заданы.
+    """
+    objects = list(objects)
+    fields = date_fields(model)
+    dates = [
+        (obj.pk, [getattr(obj, field.attname) for field in fields])
+        for obj in objects
+    ]
+    model.objects.bulk_create(objects, **kwargs)
+    if not fields:
+        return
+    for start in range(0, len(dates), DATES_BATCH_SIZE):
+        chunk = dates[start:start + DATES_BATCH_SIZE]
+        model.objects.filter(pk__in=[pk for pk, _ in chunk]).update(**{
+            field.name: Case(
+                *(When(pk=pk, then=Value(values[number]))
+                  for pk, values in chunk),
+                output_field=field,
+            )
+            for number, field in enumerate(fields)
+        })
+
+
+def add_stats(field, counts):
+    """Прибавляет к счётчику field статистики пользователей counts
+    {id пользователя: сколько}. bulk_create не шлёт post_save, поэтому
+    счётчики импорта ведутся здесь, пачка за пачкой."""
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in counts),
+        ignore_conflicts=True,
+    )
+    for user_id, count in counts.items():
+        AuthorStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + count})
+
+
+def user_ids(usernames):
+    """id пользователей по именам; недостающие создаются без пароля."""
+    usernames = set(usernames)
+    found = dict(User.objects.filter(
+        username__in=usernames).values_list('username', 'pk'))
+    missing = usernames - set(found)
+    if missing:
+        User.objects.bulk_create(
+            User(username=username, password=make_password(None))
+            for username in missing
+        )
+        found.update(User.objects.filter(
+            username__in=missing).values_list('username', 'pk'))
+    return found
+
+
+def group_ids(slugs):
+    return dict(Group.objects.filter(
+        slug__in=set(slugs)).values_list('slug', 'pk'))
+
+
+def import_groups(batch):
+    Group.objects.bulk_create(
+        (Group(slug=record['slug'], title=record['title'],
+               description=record.get('description', ''))
+         for record in batch),
+        ignore_conflicts=True,
+    )
+    bump('groups', *(f'group:{record["slug"]}' for record in batch))
+
+
+def import_posts(batch):
+    # Уже загруженные посты не вставляются, и ссылки на их картинки
+    # не учитываются второй раз.
+    existing = set(Post.objects.filter(
+        pk__in=[record['id'] for record in batch]).values_list(
+        'pk', flat=True))
+    batch = [record for record in batch if record['id'] not in existing]
+    users = user_ids(record['author'] for record in batch)
+    groups = group_ids(
+        record['group'] for record in batch if record.get('group'))
+    bulk_create_dated(
+        Post,
+        (Post(
+            pk=record['id'],
+            author_id=users[record['author']],
+            group_id=groups.get(record.get('group')),
+            text=record['text'],
+            pub_date=parse_datetime(record['pub_date']),
+            updated=parse_datetime(
+                record.get('updated') or record['pub_date']),
+            image=record.get('image') or None,
+        ) for record in batch),
+        ignore_conflicts=True,
+    )
+    add_stats('posts_count', Counter(
+        users[record['author']] for record in batch))
+    fan_out_posts([record['id'] for record in batch])
+    # Файлы картинок переносятся отдельно, а владельцем ссылок
+    # становятся новые посты.
+    media_storage.add_refs(Counter(
+        record['image'] for record in batch if record.get('image')))
+    bump(
+        'index',
+        *(f'group:{slug}' for slug in groups),
+        *(f'author:{username}' for username in users),
+    )
+
+
+def import_comments(batch):
+    """Комментарии к постам, которых нет в базе, и ответы на
+    отсутствующие комментарии пропускаются; возвращает их число."""
+    posts = set(Post.objects.filter(
+        pk__in={record['post'] for record in batch}).values_list(
+        'pk', flat=True))
+    parents = set(Comment.objects.filter(
+        pk__in={record.get('parent') for record in batch}).values_list(
+        'pk', flat=True))
+    loaded = []
+    for record in batch:
+        parent = record.get('parent')
+        if record['post'] in posts and (parent is None or parent in parents):
+            loaded.append(record)
+            # Выгрузка упорядочена по id: родитель идёт раньше ответа.
+            parents.add(record['id'])
+    skipped = len(batch) - len(loaded)
+    batch = loaded
+    users = user_ids(record['author'] for record in batch)
+    bulk_create_dated(
+        Comment,
+        (Comment(
+            pk=record['id'],
+            post_id=record['post'],
+            author_id=users[record['author']],
+            text=record['text'],
+            created=parse_datetime(record['created']),
+            parent_id=record.get('parent'),
+            path=record.get('path', ''),
+        ) for record in batch),
+        ignore_conflicts=True,
+    )
+    # В выгрузках без веток все комментарии - ответы на пост.
+    fill_paths(Comment.objects.filter(pk__in=[
+        record['id'] for record in batch if not record.get('path')]))
+    posts = Post.objects.filter(
+        pk__in={record['post'] for record in batch},
+    ).values_list('author__username', 'group__slug').distinct()
+    bump('index', *(
+        scope
+        for username, slug in posts
+        for scope in (f'author:{username}', slug and f'group:{slug}')
+        if scope
+    ))
+    return skipped
+
+
+def import_follows(batch):
+    users = user_ids(
+        [record['user'] for record in batch]
+        + [record['author'] for record in batch]
+    )
+    pairs = {
+        (users[record['user']], users[record['author']])
+        for record in batch if record['user'] != record['author']
+    }
+    # Счётчики и ленты - только для новых подписок.
+    pairs -= set(Follow.objects.filter(
+        user_id__in={user_id for user_id, _ in pairs},
+        author_id__in={author_id for _, author_id in pairs},
+    ).values_list('user_id', 'author_id'))
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in pairs),
+        ignore_conflicts=True,
+    )
+    add_stats('following_count', Counter(
+        user_id for user_id, _ in pairs))
+    add_stats('followers_count', Counter(
+        author_id for _, author_id in pairs))
+    backfill_timelines(pairs)
+    bump(*(f'author:{username}' for username in users))
+
+
+def reset_sequences():
+    """После вставки с явными id счётчики первичных ключей нужно
+    подвинуть; SQLite делает это сам, PostgreSQL - нет."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [Post, Comment])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+IMPORTERS = {
+    'group': import_groups,
+    'post': import_posts,
+    'comment': import_comments,
+    'follow': import_follows,
+}
+
+
+def import_lines(lines, batch_size=BATCH_SIZE):
+    """Загружает записи пачками, каждая пачка - своя транзакция.
+    Отдаёт (тип, число записей, число пропущенных) после каждой пачки."""
+    for kind, batch in batches(parse_lines(lines), batch_size):
+        with transaction.atomic():
+            skipped = IMPORTERS[kind](batch) or 0
+        yield kind, len(batch), skipped
+    reset_sequences()
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from posts import benchmarks, index_advisor
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Проходит страницы из замеров bench_views, снимает планы их '
+            'запросов и отмечает полные просмотры таблиц и сортировки '
+            'во временном B-дереве')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=index_advisor.MIN_ROWS,
+            help='Не отмечать полный просмотр таблиц меньше этого',
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов, а не только проблемных',
+        )
+        parser.add_argument(
+            '--fail-on-issues', action='store_true',
+            help='Завершиться с ошибкой, если есть проблемные запросы',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Разбор планов написан для SQLite')
+        try:
+            cases = benchmarks.cases()
+        except benchmarks.NoData:
+            raise CommandError(
+                'Нет записей для разбора, сначала выполните seed_data')
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        # Без кэша лент, иначе часть запросов не выполнится; записи,
+        # созданные страницами, откатываются.
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={'default': dummy, 'template_fragments': dummy},
+        ):
+            try:
+                with transaction.atomic():
+                    queries = index_advisor.replay(cases)
+                    findings = index_advisor.analyze(
+                        queries, options['min_rows'])
+                    if options['verbose_plans']:
+                        self.print_plans(queries)
+                    raise Rollback
+            except Rollback:
+                pass
+        for finding in findings:
+            self.stdout.write(self.style.WARNING(
+                f'{", ".join(sorted(finding.query.views))}: '
+                f'{"; ".join(finding.issues)}'
+            ))
+            self.stdout.write(f'  {finding.query.sql}')
+            for line in finding.plan:
+                self.stdout.write(f'    {line}')
+            if finding.suggestion:
+                self.stdout.write(
+                    f'  возможный индекс: {finding.suggestion}')
+        summary = (f'Запросов: {len(queries)}, '
+                   f'с полным просмотром или сортировкой: {len(findings)}')
+        if findings and options['fail_on_issues']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def print_plans(self, queries):
+        for query in queries:
+            plan = index_advisor.explain(connection, query.sql, query.params)
+            if plan:
+                self.stdout.write(query.sql)
+                for line in plan:
+                    self.stdout.write(f'    {line}')
@@ -0,0 +1,102 @@
+import itertools
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from yatube.cache import SQLiteCache
+
+
+def make_cache(kind, location, max_entries):
+    params = {'OPTIONS': {'MAX_ENTRIES': max_entries}}
+    if kind == 'locmem':
+        return LocMemCache('bench', params)
+    return SQLiteCache(location, params)
+
+
+def stored_bytes(kind, cache):
+    if kind == 'locmem':
+        return sum(len(value) for value in cache._cache.values())
+    return cache._db.execute('SELECT size FROM totals').fetchone()[0]
+
+
+def run_worker(kind, location, options, seed):
+    cache = make_cache(kind, location, options['max_entries'])
+    rng = random.Random(seed)
+    # Популярность страниц распределена по Ципфу: несколько горячих
+    # ключей и длинный хвост редких.
+    weights = list(itertools.accumulate(
+        1 / (rank + 1) ** options['zipf'] for rank in range(options['keys'])
+    ))
+    keys = rng.choices(
+        range(options['keys']), cum_weights=weights, k=options['requests'])
+    payload = os.urandom(options['value_size'])
+    hits = 0
+    started = time.perf_counter()
+    for key in keys:
+        if cache.get(f'page:{key}') is None:
+            cache.set(f'page:{key}', payload, 300)
+        else:
+            hits += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'hits': hits,
+        'elapsed': elapsed,
+        'stored': stored_bytes(kind, cache),
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_worker_star(args):
+    return run_worker(*args)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache и SQLiteCache при обращении '
+            'к кэшу из нескольких процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=5000,
+                            help='Обращений к кэшу на процесс')
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--zipf', type=float, default=1.1)
+        parser.add_argument('--value-size', type=int, default=20000)
+        parser.add_argument('--max-entries', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            f'{"backend":<8} {"hit rate":>9} {"ops/s":>10} '
+            f'{"cached MB":>10} {"max RSS MB":>11}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            location = os.path.join(directory, 'bench.sqlite3')
+            for kind in ('locmem', 'sqlite'):
+                jobs = [
+                    (kind, location, options, seed)
+                    for seed in range(options['workers'])
+                ]
+                with context.Pool(options['workers']) as pool:
+                    results = pool.map(run_worker_star, jobs)
+                self.report(kind, results, options)
+
+    def report(self, kind, results, options):
+        total = options['requests'] * len(results)
+        hits = sum(result['hits'] for result in results)
+        elapsed = max(result['elapsed'] for result in results)
+        if kind == 'locmem':
+            # Каждый процесс держит собственную копию кэша.
+            stored = sum(result['stored'] for result in results)
+        else:
+            stored = max(result['stored'] for result in results)
+        rss = sum(result['rss'] for result in results)
+        self.stdout.write(
+            f'{kind:<8} {hits / total:>9.1%} {total / elapsed:>10.0f} '
+            f'{stored / 2 ** 20:>10.1f} {rss / 1024:>11.1f}'
+        )
@@ -0,0 +1,143 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from posts import benchmarks, seeding
+from posts.models import Comment, Post, User
+
+PROFILES = {
+    # Как до yatube.sqlite: журнал отката, BEGIN DEFERRED и новое
+    # соединение на каждый запрос.
+    'stock': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 0,
+    },
+    'tuned': {
+        'ENGINE': 'yatube.sqlite',
+        'CONN_MAX_AGE': 60,
+    },
+}
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+
+def read(alias, rng, authors, posts):
+    """Страница профиля: первые записи автора со счётчиками."""
+    list(Post.objects.using(alias).feed().filter(
+        author_id=rng.choice(authors)).order_by('-pub_date')[:10])
+
+
+def write(alias, rng, authors, posts):
+    """Как add_comment: прочитать запись и добавить к ней комментарий
+    в одной транзакции."""
+    with transaction.atomic(using=alias):
+        post = Post.objects.using(alias).only('pk').get(pk=rng.choice(posts))
+        Comment.objects.using(alias).bulk_create([Comment(
+            post=post, author_id=rng.choice(authors),
+            text=seeding.make_text(rng, 10),
+        )])
+
+
+def work(alias, operation, seed, ids, deadline, result):
+    rng = random.Random(seed)
+    worker_connection = connections[alias]
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(alias, rng, *ids)
+            except OperationalError:
+                result.errors += 1
+            else:
+                result.latencies.append(time.perf_counter() - started)
+            # То же, что Django делает по окончании запроса.
+            worker_connection.close_if_unusable_or_obsolete()
+    finally:
+        worker_connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает стандартный бэкенд SQLite и yatube.sqlite '
+            'при одновременном чтении и записи из нескольких потоков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5,
+                            help='Длительность прогона для каждого бэкенда')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер написан для SQLite')
+        if not Post.objects.exists():
+            raise CommandError(
+                'Нет записей для замера, сначала выполните seed_data')
+        source = connection.settings_dict['NAME']
+        self.stdout.write(
+            f'{"profile":<8} {"reads/s":>9} {"read p50":>9} '
+            f'{"read p99":>9} {"writes/s":>9} {"write p99":>10} '
+            f'{"errors":>7}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                path = os.path.join(directory, f'{name}.sqlite3')
+                benchmarks.copy_database(source, path)
+                alias = f'bench_{name}'
+                connections.databases[alias] = {**profile, 'NAME': path}
+                try:
+                    readers, writers = self.run(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.databases[alias]
+                self.report(name, readers, writers, options['seconds'])
+
+    def run(self, alias, options):
+        # Свежие записи комментируют чаще всего.
+        ids = (
+            list(User.objects.using(alias).values_list('pk', flat=True)[
+                :1000]),
+            list(Post.objects.using(alias).order_by('-pk').values_list(
+                'pk', flat=True)[:1000]),
+        )
+        readers = [Result() for _ in range(options['readers'])]
+        writers = [Result() for _ in range(options['writers'])]
+        deadline = time.perf_counter() + options['seconds']
+        threads = [
+            threading.Thread(target=work, args=(
+                alias, operation, seed, ids, deadline, result))
+            for seed, (operation, result) in enumerate(
+                [(read, result) for result in readers]
+                + [(write, result) for result in writers])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return readers, writers
+
+    def report(self, name, readers, writers, seconds):
+        reads = sorted(
+            latency for result in readers for latency in result.latencies)
+        written = sorted(
+            latency for result in writers for latency in result.latencies)
+        errors = sum(result.errors for result in readers + writers)
+
+        def ms(values, share):
+            if not values:
+                return '-'
+            return f'{benchmarks.percentile(values, share) * 1000:.1f}'
+
+        self.stdout.write(
+            f'{name:<8} {len(reads) / seconds:>9.0f} {ms(reads, 50):>9} '
+            f'{ms(reads, 99):>9} {len(written) / seconds:>9.0f} '
+            f'{ms(written, 99):>10} {errors:>7}'
+        )
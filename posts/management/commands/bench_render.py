@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import get_template
+from django.test import RequestFactory, override_settings
+
+from posts.models import Group, Post, User
+
+TEXT = ('Социальная сеть для публикации дневников. '
+        'Здесь можно делиться записями и подписываться на авторов.\n') * 5
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет отрисовку карточек постов без кэша фрагментов, '
+            'с холодным и с прогретым кэшем')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100, 1000])
+        parser.add_argument('--image', default='',
+                            help='Путь к картинке внутри MEDIA_ROOT')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.stdout.write(
+            f'{"posts":>6} {"no cache, ms":>13} {"cold, ms":>9} '
+            f'{"warm, ms":>9} {"speedup":>8}'
+        )
+        # Посты для замера создаются в транзакции и откатываются.
+        try:
+            with transaction.atomic():
+                group = Group.objects.create(
+                    title='Замеры', slug='bench-render', description='')
+                for size in options['sizes']:
+                    author = User.objects.create_user(
+                        username=f'bench-render-{size}')
+                    Post.objects.bulk_create(
+                        Post(text=TEXT, author=author, group=group,
+                             image=options['image'])
+                        for _ in range(size)
+                    )
+                    posts = list(Post.objects.filter(
+                        author=author).feed()[:size])
+                    self.measure(posts, request)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, posts, request):
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        with override_settings(CACHES={
+            'default': dummy, 'template_fragments': dummy,
+        }):
+            uncached = self.render(posts, request)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={
+                'default': dummy,
+                'template_fragments': {
+                    'BACKEND': 'yatube.cache.SQLiteCache',
+                    'LOCATION': os.path.join(directory, 'bench.sqlite3'),
+                    'OPTIONS': {'MAX_ENTRIES': 100000},
+                },
+            }):
+                cold = self.render(posts, request)
+                warm = self.render(posts, request)
+        self.stdout.write(
+            f'{len(posts):>6} {uncached:>13.1f} {cold:>9.1f} '
+            f'{warm:>9.1f} {uncached / warm:>7.1f}x'
+        )
+
+    def render(self, posts, request):
+        template = get_template('parts/post_item.html')
+        started = time.perf_counter()
+        for post in posts:
+            template.render({'post': post}, request)
+        return (time.perf_counter() - started) * 1000
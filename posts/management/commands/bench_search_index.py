@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search, seeding, stemmer
+from posts.models import Post, User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость токенизации, стемминга и полной '
+            'переиндексации постов, документов в секунду')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=20000,
+            help='Сколько синтетических постов добавить на время замера',
+        )
+        parser.add_argument('--words', type=int, default=60)
+        parser.add_argument(
+            '--batch-size', type=int, default=search.REBUILD_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        texts = [
+            seeding.make_text(rng, options['words'])
+            for _ in range(options['posts'])
+        ]
+        self.stdout.write(f'{"stage":<28} {"docs/s":>10}')
+        self.report('stem, по одному', len(texts), self.stem_one, texts)
+        self.report(
+            'stem, пачками', len(texts), self.stem_batches, texts,
+            options['batch_size'],
+        )
+        # Синтетические посты создаются в транзакции и откатываются.
+        try:
+            with transaction.atomic():
+                author = User.objects.create_user(username='bench-search')
+                Post.objects.bulk_create(
+                    Post(text=text, author=author) for text in texts)
+                stemmer.stem.cache_clear()
+                started = time.perf_counter()
+                total = search.rebuild(options['batch_size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{"переиндексация таблицы":<28} {total / elapsed:>10.0f}'
+                    f'  ({total} документов за {elapsed:.2f} с)'
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, stage, count, function, *args):
+        stemmer.stem.cache_clear()
+        started = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{stage:<28} {count / elapsed:>10.0f}')
+
+    def stem_one(self, texts):
+        # Без кэша и без дедупликации внутри пачки.
+        for text in texts:
+            ' '.join(stemmer.stem.__wrapped__(word)
+                     for word in stemmer.tokenize(text))
+
+    def stem_batches(self, texts, batch_size):
+        for start in range(0, len(texts), batch_size):
+            stemmer.stem_texts(texts[start:start + batch_size])
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts import benchmarks
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет перцентили задержки и число запросов к базе для '
+            'каждой страницы из posts/urls.py и сохраняет результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Сколько запросов к каждой странице')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Замерять с кэшем лент во временной базе, '
+                 'по умолчанию кэш выключен',
+        )
+        parser.add_argument('--output', help='Куда сохранить результат')
+        parser.add_argument(
+            '--baseline', help='Результат прошлого прогона для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=benchmarks.LATENCY_THRESHOLD,
+            help='Допустимый рост медианы задержки, доля',
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Завершиться с ошибкой, если есть регрессии',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cases = benchmarks.cases()
+        except benchmarks.NoData:
+            raise CommandError(
+                'Нет записей для замера, сначала выполните seed_data')
+        measured = {case.name for case in cases}
+        missing = [
+            name for name in benchmarks.url_names() if name not in measured]
+        if missing:
+            self.stderr.write(f'Не замеряются: {", ".join(missing)}')
+        result = {
+            'created': timezone.now().isoformat(),
+            'commit': benchmarks.commit(),
+            'options': {
+                'requests': options['requests'],
+                'cache': options['cache'],
+            },
+            'dataset': benchmarks.dataset(),
+            'views': {},
+        }
+        self.stdout.write(
+            f'{"view":<22} {"p50, ms":>9} {"p90, ms":>9} {"p99, ms":>9} '
+            f'{"queries":>8} {"status":>7}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                CACHES=self.caches(options['cache'], directory),
+            ):
+                # Записи, комментарии и подписки из замеров откатываются.
+                try:
+                    with transaction.atomic():
+                        for case in cases:
+                            summary = self.measure(
+                                case, options['requests'], options['warmup'])
+                            result['views'][benchmarks.case_key(case)] = (
+                                summary)
+                        raise Rollback
+                except Rollback:
+                    pass
+        path = benchmarks.save(result, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Результат сохранён в {path}'))
+        if options['baseline']:
+            regressions = self.compare(
+                benchmarks.load(options['baseline']), result,
+                options['threshold'],
+            )
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Регрессии: {", ".join(regressions)}')
+
+    def caches(self, enabled, directory):
+        if not enabled:
+            dummy = {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            return {'default': dummy, 'template_fragments': dummy}
+        # Отдельная база, чтобы страницы с откатываемыми данными
+        # не попали в настоящий кэш.
+        return {'default': {
+            'BACKEND': 'yatube.cache.SQLiteCache',
+            'LOCATION': os.path.join(directory, 'bench.sqlite3'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }}
+
+    def measure(self, case, requests, warmup):
+        client = Client()
+        if case.user is not None:
+            client.force_login(case.user)
+        send = getattr(client, case.method)
+        for _ in range(warmup):
+            send(case.url, case.data)
+        latencies = []
+        queries = []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(case.url, case.data)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        summary = benchmarks.summarize(
+            latencies, queries, response.status_code)
+        self.stdout.write(
+            f'{benchmarks.case_key(case):<22} {summary["p50"]:>9.2f} '
+            f'{summary["p90"]:>9.2f} {summary["p99"]:>9.2f} '
+            f'{summary["queries"]:>8} {summary["status"]:>7}'
+        )
+        return summary
+
+    def compare(self, baseline, result, threshold):
+        if baseline['dataset'] != result['dataset']:
+            self.stderr.write(
+                'Данные отличаются от прошлого прогона, сравнение неточно')
+        self.stdout.write(
+            f'\nСравнение с {baseline.get("commit") or "прошлым прогоном"}\n'
+            f'{"view":<22} {"p50 было":>9} {"стало":>9} {"Δ":>7} '
+            f'{"запросы":>9}'
+        )
+        regressions = []
+        for name, before, now, queries_before, queries_now, worse in (
+                benchmarks.compare(baseline, result, threshold)):
+            change = (now - before) / before * 100 if before else 0
+            line = (
+                f'{name:<22} {before:>9.2f} {now:>9.2f} {change:>+6.0f}% '
+                f'{queries_before:>4} → {queries_now:<3}'
+            )
+            if worse:
+                regressions.append(name)
+                line = self.style.ERROR(line + ' регрессия')
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,115 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.test import override_settings
+
+from posts import benchmarks, seeding, write_buffer
+from posts.models import Comment, Follow, Post, User
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+
+def work(seed, users, posts, options, deadline, result):
+    rng = random.Random(seed)
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < options['follow_share']:
+                instance = Follow(
+                    user_id=rng.choice(users), author_id=rng.choice(users))
+            else:
+                instance = Comment(
+                    post_id=rng.choice(posts), author_id=rng.choice(users),
+                    text=seeding.make_text(rng, 10),
+                )
+            started = time.perf_counter()
+            try:
+                write_buffer.save(instance)
+            except DatabaseError:
+                result.errors += 1
+            else:
+                result.latencies.append(time.perf_counter() - started)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Замеряет, сколько комментариев и подписок в секунду '
+            'записывают параллельные запросы с posts.write_buffer и без')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Одновременных пишущих запросов')
+        parser.add_argument('--seconds', type=float, default=5,
+                            help='Длительность прогона для каждого режима')
+        parser.add_argument('--delay', type=float, default=2,
+                            help='WRITE_BUFFER_DELAY_MS для пачек, мс')
+        parser.add_argument('--follow-share', type=float, default=0.2,
+                            help='Доля подписок среди записей')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер написан для SQLite')
+        if not Post.objects.exists():
+            raise CommandError(
+                'Нет записей для замера, сначала выполните seed_data')
+        source = connection.settings_dict['NAME']
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        self.stdout.write(
+            f'{"mode":<9} {"writes/s":>9} {"p50 ms":>8} {"p99 ms":>8} '
+            f'{"rows":>7} {"errors":>7}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, delay in (('direct', None),
+                                ('buffered', options['delay'])):
+                path = os.path.join(directory, f'{mode}.sqlite3')
+                benchmarks.copy_database(source, path)
+                with benchmarks.swap_database(path), override_settings(
+                    WRITE_BUFFER_DELAY_MS=delay,
+                    CACHES={'default': dummy, 'template_fragments': dummy},
+                ):
+                    results, rows = self.run(options)
+                self.report(mode, results, rows, options['seconds'])
+
+    def run(self, options):
+        users = list(User.objects.values_list('pk', flat=True)[:1000])
+        posts = list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:1000])
+        before = Comment.objects.count() + Follow.objects.count()
+        results = [Result() for _ in range(options['threads'])]
+        deadline = time.perf_counter() + options['seconds']
+        threads = [
+            threading.Thread(target=work, args=(
+                seed, users, posts, options, deadline, result))
+            for seed, result in enumerate(results)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = Comment.objects.count() + Follow.objects.count() - before
+        return results, rows
+
+    def report(self, mode, results, rows, seconds):
+        latencies = sorted(
+            latency for result in results for latency in result.latencies)
+        errors = sum(result.errors for result in results)
+        if latencies:
+            p50, p99 = (
+                f'{benchmarks.percentile(latencies, share) * 1000:.1f}'
+                for share in (50, 99)
+            )
+        else:
+            p50 = p99 = '-'
+        self.stdout.write(
+            f'{mode:<9} {len(latencies) / seconds:>9.0f} {p50:>8} '
+            f'{p99:>8} {rows:>7} {errors:>7}'
+        )
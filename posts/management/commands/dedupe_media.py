@@ -0,0 +1,111 @@
+import os
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import MediaFile, Post
+from posts.storage import content_hash, content_name, media_storage
+from posts.thumbnails import generate_thumbnail
+from posts.variants import generate_variants, load_variants
+
+
+class Command(BaseCommand):
+    help = ('Переименовывает картинки постов по хэшу содержимого, '
+            'удаляет одинаковые копии и пересчитывает ссылки на файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет сделано',
+        )
+        parser.add_argument(
+            '--directory', default='posts',
+            help='Каталог внутри MEDIA_ROOT с картинками постов',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        referenced = set(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('image', flat=True)
+        )
+        renamed = {}
+        seen = set()
+        freed = 0
+        names = referenced | set(self.walk(options['directory']))
+        # Сначала используемые файлы: под именем-хэшем остаётся их копия.
+        for name in sorted(names, key=lambda n: (n not in referenced, n)):
+            if not media_storage.exists(name):
+                self.stderr.write(f'Файл не найден: {name}')
+                continue
+            with media_storage.open(name) as content:
+                target = content_name(name, content_hash(content))
+            if target == name:
+                continue
+            size = media_storage.size(name)
+            if target in seen or media_storage.exists(target):
+                # Такие же байты уже лежат под именем-хэшем.
+                freed += size
+                self.remove(name)
+            else:
+                self.move(name, target)
+            if name in referenced:
+                renamed[name] = target
+            seen.add(target)
+        if not self.dry_run:
+            self.update_posts(renamed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Переименовано картинок: {len(renamed)}, '
+            f'освобождено байт: {freed}'
+        ))
+
+    def walk(self, directory):
+        # Вложенные каталоги (варианты, миниатюры) не трогаем.
+        _, files = media_storage.listdir(directory)
+        return [
+            os.path.join(directory, filename) for filename in files
+            if not filename.endswith('.part')
+        ]
+
+    def remove(self, name):
+        self.stdout.write(f'Удалён дубликат {name}')
+        if not self.dry_run:
+            # Мимо счётчиков: у старых файлов их нет.
+            os.remove(media_storage.path(name))
+
+    def move(self, name, target):
+        self.stdout.write(f'{name} -> {target}')
+        if not self.dry_run:
+            os.replace(media_storage.path(name), media_storage.path(target))
+
+    def update_posts(self, renamed):
+        with transaction.atomic():
+            for name, target in renamed.items():
+                # update() без сигналов: старое имя не нужно освобождать.
+                Post.objects.filter(image=name).update(image=target)
+            rebuild_refs()
+        posts = Post.objects.filter(image__in=set(renamed.values()))
+        for post in posts.iterator():
+            generate_thumbnail(post)
+            generate_variants(post)
+
+
+def rebuild_refs():
+    refs = Counter(
+        Post.objects.exclude(image='').exclude(image__isnull=True)
+        .values_list('image', flat=True)
+    )
+    for post in Post.objects.exclude(image_variants='').only(
+            'image_variants').iterator():
+        refs.update(variant['name'] for variant in load_variants(post))
+    MediaFile.objects.all().delete()
+    MediaFile.objects.bulk_create(
+        MediaFile(
+            name=name,
+            refs=count,
+            size=media_storage.size(name)
+            if media_storage.exists(name) else 0,
+        )
+        for name, count in refs.items()
+    )
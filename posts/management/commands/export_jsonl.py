@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import jsonl
+
+
+class Command(BaseCommand):
+    help = ('Выгружает сообщества, посты, комментарии и подписки в JSONL, '
+            'по одной записи на строку')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для записи, "-" - стандартный вывод',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=jsonl.BATCH_SIZE,
+            help='Сколько строк читать из базы за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        output = (sys.stdout if path == '-'
+                  else open(path, 'w', encoding='utf-8'))
+        started = time.perf_counter()
+        total = 0
+        try:
+            for line in jsonl.dump_lines(
+                    jsonl.export_rows(options['batch_size'])):
+                output.write(line + '\n')
+                total += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.perf_counter() - started
+        # Отчёт в stderr, чтобы не смешивать его с данными в stdout.
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено {total} записей за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-9):.0f} записей/с)'
+        ))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.media_gc import (BATCH_SIZE, forget_source, forget_thumbnail,
+                            orphaned_files, orphaned_sources, walk_media)
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT файлы, на которые не ссылается ни один '
+            'пост, и миниатюры удалённых картинок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, сколько места освободится',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд: они могут '
+                 'быть ещё не сохранены в посте',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        sources = 0
+        # Сначала забываем миниатюры картинок, которых нет ни в одном
+        # посте: их файлы потеряют ссылки и уйдут при обходе ниже.
+        for batch in orphaned_sources(batch_size):
+            for source in batch:
+                sources += 1
+                if not dry_run:
+                    forget_source(source)
+        # Затем всё, что осталось без ссылок.
+        deadline = time.time() - options['min_age']
+        files = (
+            item for item in walk_media()
+            if item[2] < deadline and not item[0].endswith('.part')
+        )
+        count = size = 0
+        for batch in orphaned_files(files, batch_size):
+            for name, file_size, _ in batch:
+                count += 1
+                size += file_size
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+                if dry_run:
+                    continue
+                default_storage.delete(name)
+                if name.startswith(thumbnail_settings.THUMBNAIL_PREFIX):
+                    forget_thumbnail(name)
+        verb = 'Можно удалить' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {count}, {size} байт. '
+            f'Картинок без постов в хранилище миниатюр: {sources}'
+        ))
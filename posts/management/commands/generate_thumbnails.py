@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры картинок постов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать миниатюры всех постов с картинками',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            posts = posts.filter(
+                Q(thumbnail__isnull=True) | Q(thumbnail=''))
+        total = 0
+        for post in posts.iterator():
+            generate_thumbnail(post)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {total}'
+        ))
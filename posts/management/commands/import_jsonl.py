@@ -0,0 +1,64 @@
+import sys
+import time
+from collections import Counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import jsonl
+
+
+class Command(BaseCommand):
+    help = ('Загружает сообщества, посты, комментарии и подписки из JSONL '
+            'пачками через bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для чтения, "-" - стандартный ввод',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=jsonl.BATCH_SIZE,
+            help='Сколько записей вставлять в одной транзакции',
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать индекс поиска',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        lines = (sys.stdin if path == '-'
+                 else open(path, encoding='utf-8'))
+        started = time.perf_counter()
+        counts = Counter()
+        skipped = Counter()
+        try:
+            for kind, count, missing in jsonl.import_lines(
+                    lines, options['batch_size']):
+                counts[kind] += count
+                skipped[kind] += missing
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{kind}: {counts[kind]}')
+        except jsonl.InvalidRecord as error:
+            raise CommandError(error)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        summary = ', '.join(
+            f'{kind} {counts[kind]}' for kind in jsonl.TYPES if counts[kind])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {total} записей ({summary or "нет"}) '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} записей/с)'
+        ))
+        if skipped['comment']:
+            self.stderr.write(
+                f'Пропущено комментариев без поста или родителя: '
+                f'{skipped["comment"]}')
+        # bulk_create не вызывает сигналы. Статистика и ленты
+        # дополняются с каждой пачкой, индекс поиска пересчитывается
+        # один раз после загрузки.
+        if not options['no_rebuild'] and total:
+            call_command('rebuild_search_index', stdout=self.stdout)
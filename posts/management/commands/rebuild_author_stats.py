@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats, Follow, Post, User
+
+
+def count_by(queryset, field):
+    return dict(
+        queryset.order_by().values_list(field).annotate(total=Count('pk'))
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики записей и подписок всех пользователей'
+
+    def handle(self, *args, **options):
+        posts = count_by(Post.objects.all(), 'author')
+        followers = count_by(Follow.objects.all(), 'author')
+        following = count_by(Follow.objects.all(), 'user')
+        fanout_on_read = set(AuthorStats.objects.filter(
+            fanout_on_read=True).values_list('user_id', flat=True))
+        with transaction.atomic():
+            AuthorStats.objects.all().delete()
+            AuthorStats.objects.bulk_create(
+                AuthorStats(
+                    user_id=user_id,
+                    posts_count=posts.get(user_id, 0),
+                    followers_count=followers.get(user_id, 0),
+                    following_count=following.get(user_id, 0),
+                    fanout_on_read=user_id in fanout_on_read,
+                )
+                for user_id in User.objects.values_list('pk', flat=True)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитана статистика {AuthorStats.objects.count()} '
+            'пользователей'
+        ))
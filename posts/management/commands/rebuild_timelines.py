@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Follow, TimelineEntry
+from posts.timelines import BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Заново раскладывает записи авторов по лентам подписчиков'
+
+    def handle(self, *args, **options):
+        pairs = Follow.objects.filter(
+            author__posts__isnull=False,
+        ).exclude(
+            author__stats__fanout_on_read=True,
+        ).values_list('user_id', 'author__posts', 'author__posts__pub_date')
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            TimelineEntry.objects.bulk_create(
+                (TimelineEntry(user_id=user_id, post_id=post_id,
+                               pub_date=pub_date)
+                 for user_id, post_id, pub_date in pairs.iterator()),
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'В ленты разложено {TimelineEntry.objects.count()} записей'
+        ))
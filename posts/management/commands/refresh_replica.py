@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from yatube import replicas
+
+
+class Command(BaseCommand):
+    help = ('Снимает копию основной базы для чтения лент '
+            '(REPLICA_PATH) и обновляет её с заданным интервалом')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Снять копию один раз и выйти',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            default=settings.REPLICA_REFRESH_INTERVAL,
+            help='Секунд между снимками',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = replicas.refresh()
+            self.stdout.write(
+                f'Копия снята за {time.time() - started:.2f} с')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
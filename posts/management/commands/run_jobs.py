@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+# Процессы пула запускаются через spawn и импортируют этот модуль
+# до django.setup(), поэтому модели импортируются внутри функций.
+def init_process():
+    django.setup()
+
+
+def execute_job(pk):
+    from posts.jobs import run_job
+    return run_job(pk)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Размер пула процессов; 0 - выполнять задачи в этом процессе',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        processes = options['processes']
+        if processes == 0:
+            self.loop(lambda pks: map(execute_job, pks), 1, options)
+            return
+        # spawn, а не fork: соединение с базой нельзя делить с дочерним
+        # процессом, а новый интерпретатор откроет своё.
+        with ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process,
+        ) as pool:
+            self.loop(
+                lambda pks: pool.map(execute_job, pks), processes, options)
+
+    def loop(self, execute, batch, options):
+        from posts.jobs import claim
+        while True:
+            close_old_connections()
+            pks = claim(self.worker, batch)
+            if pks:
+                results = list(execute(pks))
+                self.stdout.write(
+                    f'Выполнено задач: {results.count(True)}, '
+                    f'с ошибкой: {results.count(False)}'
+                )
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
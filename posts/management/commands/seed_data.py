@@ -0,0 +1,103 @@
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from posts import seeding, threads
+from posts.jsonl import bulk_create_dated, date_fields, reset_sequences
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, сообществами, '
+            'записями, комментариями и подписками для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=10000,
+            help='Сколько строк создать всего, от 10^4 до 10^7',
+        )
+        for kind in seeding.SHARES:
+            parser.add_argument(
+                f'--{kind}', type=int,
+                help=f'Задать число строк "{kind}" вместо доли от --rows',
+            )
+        parser.add_argument(
+            '--batch-size', type=int, default=seeding.BATCH_SIZE)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты записей',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--prefix', default='seed-',
+            help='Начало имён пользователей и адресов сообществ',
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать статистику, ленты и индекс поиска',
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}" уже есть, '
+                'укажите другой --prefix')
+        counts = seeding.plan(options['rows'])
+        for kind in counts:
+            if options[kind] is not None:
+                counts[kind] = options[kind]
+        self.batch_size = options['batch_size']
+        seeder = seeding.Seeder(
+            random.Random(options['seed']), prefix, timezone.now(),
+            options['days'],
+        )
+        self.insert(User, seeder.users(counts['users']))
+        users = seeding.id_space(
+            User.objects.filter(username__startswith=prefix))
+        self.insert(Group, seeder.groups(counts['groups']))
+        groups = seeding.id_space(
+            Group.objects.filter(slug__startswith=prefix))
+        self.insert(Post, seeder.posts(counts['posts'], users, groups))
+        posts = seeding.id_space(
+            Post.objects.filter(author__username__startswith=prefix))
+        if posts:
+            self.insert(
+                Comment, seeder.comments(counts['comments'], users, posts))
+            threads.fill_paths()
+        self.insert(Follow, seeder.follows(counts['follows'], users))
+        if not options['no_rebuild']:
+            for command in ('rebuild_author_stats', 'rebuild_timelines',
+                            'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+
+    def insert(self, model, objects):
+        """Вставляет строки пачками, каждая пачка - своя транзакция."""
+        started = time.perf_counter()
+        total = 0
+        dated = bool(date_fields(model))
+        # Даты записей ставятся UPDATE по pk (см. bulk_create_dated),
+        # поэтому pk задаются заранее.
+        next_pk = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        for chunk in seeding.chunks(objects, self.batch_size):
+            with transaction.atomic():
+                if dated:
+                    for pk, obj in enumerate(chunk, next_pk):
+                        obj.pk = pk
+                    bulk_create_dated(model, chunk, ignore_conflicts=True)
+                else:
+                    model.objects.bulk_create(chunk, ignore_conflicts=True)
+            next_pk += len(chunk)
+            total += len(chunk)
+        if dated:
+            reset_sequences()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{model._meta.model_name:<8} {total:>9} строк за '
+            f'{elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с)'
+        )
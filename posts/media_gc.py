@@ -0,0 +1,118 @@
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore
+
+from .models import MediaFile, Post
+from .storage import media_storage
+
+BATCH_SIZE = 1000
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def referenced_names(names):
+    """Имена из names, на которые ссылаются посты или счётчики MediaFile."""
+    names = list(names)
+    live = set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True))
+    live.update(Post.objects.filter(thumbnail__in=names).values_list(
+        'thumbnail', flat=True))
+    live.update(MediaFile.objects.filter(name__in=names).values_list(
+        'name', flat=True))
+    return live
+
+
+def walk_media(root=None):
+    """Обходит MEDIA_ROOT по одному файлу, не собирая список целиком.
+    Выдаёт (имя относительно MEDIA_ROOT, размер, время изменения)."""
+    root = root or settings.MEDIA_ROOT
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            yield name, stat.st_size, stat.st_mtime
+
+
+def orphaned_files(files, batch_size=BATCH_SIZE):
+    for batch in batched(files, batch_size):
+        live = referenced_names(name for name, _, _ in batch)
+        yield [item for item in batch if item[0] not in live]
+
+
+def thumbnail_sources(batch_size=BATCH_SIZE):
+    """Исходные картинки из хранилища ключей sorl, пачками.
+
+    Ключи перебираются по возрастанию, а не курсором, чтобы между
+    пачками из хранилища можно было удалять записи.
+    """
+    prefix = f'{thumbnail_settings.THUMBNAIL_KEY_PREFIX}||thumbnails||'
+    last = prefix
+    while True:
+        keys = list(KVStore.objects.filter(
+            key__startswith=prefix, key__gt=last,
+        ).order_by('key').values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return
+        last = keys[-1]
+        sources = (default.kvstore._get(key[len(prefix):]) for key in keys)
+        yield [source for source in sources if source]
+
+
+def orphaned_sources(batch_size=BATCH_SIZE):
+    for sources in thumbnail_sources(batch_size):
+        live = set(Post.objects.filter(
+            image__in=[source.name for source in sources],
+        ).values_list('image', flat=True))
+        yield [source for source in sources if source.name not in live]
+
+
+def forget_source(source):
+    """Удаляет записи sorl о картинке и её миниатюрах. Сами файлы
+    миниатюр остаются без ссылок и удаляются обходом MEDIA_ROOT."""
+    kvstore = default.kvstore
+    for key in kvstore._get(source.key, identity='thumbnails') or ():
+        kvstore._delete(key)
+    kvstore._delete(source.key, identity='thumbnails')
+    kvstore._delete(source.key)
+
+
+def forget_thumbnail(name):
+    """Удаляет запись sorl об удалённом файле миниатюры, иначе sorl
+    продолжит отдавать ссылку на него."""
+    default.kvstore.delete(
+        ImageFile(name, default.storage), delete_thumbnails=False)
+
+
+def collect_source(name):
+    """Удаляет миниатюры картинки, на которую больше не ссылается ни
+    один пост, и сам файл, если его не учитывает MediaFile."""
+    if Post.objects.filter(image=name).exists():
+        return
+    for storage in (media_storage, default_storage):
+        default.kvstore.delete(ImageFile(name, storage))
+    if MediaFile.objects.filter(name=name).exists():
+        return
+    try:
+        default_storage.delete(name)
+    except SuspiciousFileOperation:
+        # Путь вне MEDIA_ROOT: такой файл не наш.
+        pass
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.TextField(blank=True, default='', editable=False, help_text='JSON-список файлов разной ширины и формата', verbose_name='Варианты картинки'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+CREATE = """
+CREATE VIRTUAL TABLE posts_search USING fts5(
+    body,
+    post_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+FILL = """
+INSERT INTO posts_search (rowid, body, post_id)
+SELECT 2 * id, text, id FROM posts_post
+UNION ALL
+SELECT 2 * id + 1, text, post_id FROM posts_comment
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_mediafile'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, 'DROP TABLE posts_search'),
+        migrations.RunSQL(FILL, migrations.RunSQL.noop),
+    ]
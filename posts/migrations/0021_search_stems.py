@@ -0,0 +1,56 @@
+from django.db import migrations
+
+CREATE = """
+CREATE VIRTUAL TABLE posts_search USING fts5(
+    body UNINDEXED,
+    stems,
+    post_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+CREATE_PREVIOUS = """
+CREATE VIRTUAL TABLE posts_search USING fts5(
+    body,
+    post_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+def fill_search_index(apps, schema_editor):
+    from posts.stemmer import stem_texts
+
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    documents = [
+        (2 * pk, text, pk)
+        for pk, text in Post.objects.values_list('pk', 'text')
+    ] + [
+        (2 * pk + 1, text, post_id)
+        for pk, text, post_id in Comment.objects.values_list(
+            'pk', 'text', 'post_id')
+    ]
+    stems = stem_texts(text for _, text, _ in documents)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_search (rowid, body, stems, post_id) '
+            'VALUES (%s, %s, %s, %s)',
+            [
+                [rowid, text, stemmed, post_id]
+                for (rowid, text, post_id), stemmed in zip(documents, stems)
+            ],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_search_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL('DROP TABLE posts_search', CREATE_PREVIOUS),
+        migrations.RunSQL(CREATE, 'DROP TABLE posts_search'),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .storage import media_storage
+from .variants import sources
 
 User = get_user_model()
 
+# Путь комментария в ветке - id предков и его собственный, каждый
+# с ведущими нулями до COMMENT_PATH_WIDTH цифр.
+COMMENT_PATH_WIDTH = 10
+COMMENT_PATH_LENGTH = 250
+COMMENT_MAX_DEPTH = COMMENT_PATH_LENGTH // COMMENT_PATH_WIDTH
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -22,6 +33,33 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        # Подзапрос по индексу (post, created), а не JOIN с GROUP BY по
+        # всем столбцам поста: с группировкой SQLite не может читать
+        # записи в порядке индекса и сортирует всю выборку.
+        comments = Comment.objects.filter(
+            post=models.OuterRef('pk'),
+        ).order_by().values('post').annotate(
+            total=models.Count('pk'),
+        ).values('total')
+        return self.select_related('group', 'author').annotate(
+            comment_count=Coalesce(
+                models.Subquery(comments, output_field=models.IntegerField()),
+                0,
+            ),
+        )
+
+    def count(self):
+        # На число записей счётчик комментариев не влияет, а Django
+        # считал бы его для каждой строки ради COUNT(*). В values('pk')
+        # счётчика нет, и считаются только id.
+        if (self._result_cache is not None
+                or 'comment_count' not in self.query.annotation_select):
+            return super().count()
+        return self.values('pk').count()
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст',
@@ -31,10 +69,16 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
+        # Хватает составного индекса (author, pub_date, id).
+        db_index=False,
         verbose_name='Автор',
     )
     group = models.ForeignKey(
@@ -43,17 +87,68 @@ class Post(models.Model):
         blank=True,
         null=True,
         related_name='posts',
+        # Хватает составного индекса (group, pub_date, id).
+        db_index=False,
         verbose_name='Сообщество',
         help_text='Здесь выбираем сообщество',
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=media_storage,
         blank=True,
         null=True
     )
+    thumbnail = models.ImageField(
+        'Миниатюра',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    thumbnail_width = models.PositiveIntegerField(
+        'Ширина миниатюры',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    thumbnail_height = models.PositiveIntegerField(
+        'Высота миниатюры',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        default='',
+        editable=False,
+        help_text='JSON-список файлов разной ширины и формата',
+    )
+    image_processing = models.BooleanField(
+        'Картинка обрабатывается',
+        default=False,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_id_idx',
+            ),
+            # Ленты сообщества и автора: отбор и порядок из одного
+            # индекса, без сортировки.
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         author = self.author
@@ -65,12 +160,17 @@ class Post(models.Model):
 
     short_text.short_description = 'Начало поста'
 
+    def image_sources(self):
+        return sources(self)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
+        # Хватает составных индексов (post, created) и (post, path).
+        db_index=False,
         verbose_name='Пост',
     )
     author = models.ForeignKey(
@@ -87,6 +187,66 @@ class Comment(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='replies',
+        verbose_name='Ответ на',
+    )
+    path = models.CharField(
+        'Путь в ветке',
+        max_length=COMMENT_PATH_LENGTH,
+        blank=True,
+        default='',
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Число и время последнего комментария поста без чтения
+            # самих строк.
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+            # Ветка комментария - диапазон этого индекса.
+            models.Index(
+                fields=['post', 'path'],
+                name='comment_post_path_idx',
+            ),
+        ]
+
+    @property
+    def depth(self):
+        return max(len(self.path) // COMMENT_PATH_WIDTH - 1, 0)
+
+    def limit_depth(self):
+        # Слишком глубокий ответ встаёт рядом с тем, на что отвечает.
+        if (self.parent is not None
+                and self.parent.depth + 1 >= COMMENT_MAX_DEPTH):
+            self.parent = self.parent.parent
+
+    def make_path(self):
+        return (
+            (self.parent.path if self.parent is not None else '')
+            + str(self.pk).zfill(COMMENT_PATH_WIDTH)
+        )
+
+    def save(self, *args, **kwargs):
+        self.limit_depth()
+        using = kwargs.get('using') or router.db_for_write(
+            Comment, instance=self)
+        # Без пути комментарий не попадает в ветку: вставка и путь
+        # записываются вместе.
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if not self.path:
+                # Путь содержит id, поэтому записывается после вставки.
+                self.path = self.make_path()
+                Comment.objects.using(using).filter(pk=self.pk).update(
+                    path=self.path)
 
 
 class Follow(models.Model):
@@ -100,8 +260,168 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        # Хватает составного индекса (author, user).
+        db_index=False,
         verbose_name='Автор',
     )
 
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            # Подписчики автора без чтения строк таблицы.
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        'Записей',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        'Подписан',
+        default=0,
+    )
+    fanout_on_read = models.BooleanField(
+        'Лента собирается при чтении',
+        default=False,
+        help_text='Записи автора не раскладываются по лентам подписчиков',
+    )
+
+    def __str__(self):
+        return f'{self.user} - статистика'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    # Копия Post.pub_date: страница ленты - диапазон индекса
+    # (user, -pub_date, -post), без чтения и сортировки всех записей.
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не удалась'),
+    )
+
+    kind = models.CharField(
+        'Тип задачи',
+        max_length=50,
+    )
+    payload = models.TextField(
+        'Параметры',
+        default='{}',
+        help_text='Аргументы обработчика в JSON',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0,
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток',
+        default=5,
+    )
+    run_after = models.DateTimeField(
+        'Запустить после',
+        default=timezone.now,
+    )
+    locked_at = models.DateTimeField(
+        'Взята в работу',
+        blank=True,
+        null=True,
+    )
+    locked_by = models.CharField(
+        'Обработчик',
+        max_length=100,
+        blank=True,
+    )
+    last_error = models.TextField(
+        'Последняя ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        'Создана',
+        auto_now_add=True,
+    )
+    finished = models.DateTimeField(
+        'Завершена',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'],
+                name='job_status_run_after_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} - {self.get_status_display()}'
+
+
+class MediaFile(models.Model):
+    name = models.CharField(
+        'Путь к файлу',
+        max_length=255,
+        unique=True,
+    )
+    refs = models.PositiveIntegerField(
+        'Число ссылок',
+        default=1,
+    )
+    size = models.PositiveIntegerField(
+        'Размер, байт',
+        default=0,
+    )
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,170 @@
+import base64
+import binascii
+import collections.abc
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+
+POSTS_PER_PAGE = 10
+# Страниц с номерами; дальше лента листается по курсору.
+SHALLOW_PAGES = 5
+
+OLDER = 'o'
+NEWER = 'n'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(collections.abc.Sequence):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(OLDER, self.object_list[-1])
+        return None
+
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(NEWER, self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу (field, pk) без COUNT(*) и OFFSET.
+
+    Курсор непрозрачен для клиента: в нём закодированы направление
+    и ключ крайней записи текущей страницы.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, field='pub_date'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.field = field
+
+    def encode_cursor(self, direction, obj):
+        value = self.object_list.model._meta.get_field(
+            self.field).value_to_string(obj)
+        raw = json.dumps([direction, value, obj.pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, value, pk = json.loads(raw.decode())
+            value = self.object_list.model._meta.get_field(
+                self.field).to_python(value)
+            pk = int(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise InvalidCursor(cursor)
+        if direction not in (OLDER, NEWER) or value is None:
+            raise InvalidCursor(cursor)
+        return direction, value, pk
+
+    def window(self, direction=None, value=None, pk=None, limit=None):
+        """Не больше limit записей за ключом (value, pk) в порядке
+        страницы; без ключа - с начала ленты."""
+        return keyset(
+            self.object_list, direction, value, pk, self.field)[:limit]
+
+    def get_page(self, cursor=None):
+        try:
+            direction, value, pk = self.decode_cursor(cursor or '')
+        except InvalidCursor:
+            return self.first_page()
+        items = list(self.window(direction, value, pk, self.per_page + 1))
+        if direction == OLDER:
+            return CursorPage(
+                items[:self.per_page], self,
+                has_next=len(items) > self.per_page,
+                has_previous=True,
+            )
+        return CursorPage(
+            items[:self.per_page][::-1], self,
+            has_next=True,
+            has_previous=len(items) > self.per_page,
+        )
+
+    def first_page(self):
+        items = list(self.window(limit=self.per_page + 1))
+        return CursorPage(
+            items[:self.per_page], self,
+            has_next=len(items) > self.per_page,
+            has_previous=False,
+        )
+
+
+def keyset(queryset, direction=None, value=None, pk=None, field='pub_date',
+           pk_field='pk'):
+    """queryset в порядке страницы: OLDER - по убыванию ключа
+    (field, pk_field) после (value, pk), NEWER - по возрастанию, без
+    направления - по убыванию с начала. Без pk ключ - одно field."""
+    if direction == NEWER:
+        queryset = queryset.order_by(field, pk_field)
+    else:
+        queryset = queryset.order_by(f'-{field}', f'-{pk_field}')
+    if value is None:
+        return queryset
+    older = direction == OLDER
+    if pk is None:
+        return queryset.filter(
+            **{f'{field}__{"lt" if older else "gt"}': value})
+    return queryset.filter(
+        **{f'{field}__{"lte" if older else "gte"}': value},
+    ).exclude(
+        **{field: value, f'{pk_field}__{"gte" if older else "lte"}': pk},
+    )
+
+
+def paginate(request, posts, per_page=POSTS_PER_PAGE):
+    """Первые SHALLOW_PAGES страниц ленты - по номерам, дальше - по
+    курсору: ни COUNT(*) всей ленты, ни глубокого OFFSET.
+
+    posts - queryset ленты или CursorPaginator, который сам выбирает
+    записи за ключом (см. posts.timelines).
+    """
+    if isinstance(posts, CursorPaginator):
+        cursor_paginator = posts
+    else:
+        cursor_paginator = CursorPaginator(posts, per_page)
+    if 'cursor' in request.GET:
+        return cursor_paginator, cursor_paginator.get_page(
+            request.GET['cursor'])
+    per_page = cursor_paginator.per_page
+    limit = SHALLOW_PAGES * per_page
+    head = cursor_paginator.window(limit=limit + 1)
+    paginator = Paginator(head, per_page)
+    # Записи считаются только до последней номерной страницы.
+    counted = head.count()
+    paginator.count = min(counted, limit)
+    page = paginator.get_page(request.GET.get('page'))
+    paginator.next_cursor = None
+    if counted > limit and page.number == paginator.num_pages:
+        paginator.next_cursor = cursor_paginator.encode_cursor(
+            OLDER, page[-1])
+    return paginator, page
@@ -0,0 +1,233 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Каждый пост и каждый комментарий - отдельный документ таблицы
+posts_search. rowid документа кодирует его источник: у поста это
+2 * id, у комментария 2 * id + 1, поэтому обновление и удаление
+документа не требуют просмотра таблицы.
+
+Индексируются основы слов (см. posts.stemmer), исходный текст хранится
+рядом без индекса и нужен только для фрагментов с подсветкой.
+"""
+import base64
+import binascii
+import json
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post
+from .stemmer import stem, stem_text, stem_texts
+
+TABLE = 'posts_search'
+RESULTS_PER_PAGE = 10
+REBUILD_BATCH_SIZE = 1000
+SNIPPET_WORDS = 16
+WORD = re.compile(r'\w+')
+
+Hit = namedtuple('Hit', 'post comment_id score snippet')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def post_rowid(post_id):
+    return 2 * post_id
+
+
+def comment_rowid(comment_id):
+    return 2 * comment_id + 1
+
+
+INSERT = (
+    f'INSERT INTO {TABLE} (rowid, body, stems, post_id) '
+    f'VALUES (%s, %s, %s, %s)'
+)
+
+
+def index_document(rowid, post_id, body):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(INSERT, [rowid, body, stem_text(body), post_id])
+
+
+def remove_documents(*rowids):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [[rowid] for rowid in rowids],
+        )
+
+
+def index_post(post):
+    index_document(post_rowid(post.pk), post.pk, post.text)
+
+
+def index_comment(comment):
+    index_document(comment_rowid(comment.pk), comment.post_id, comment.text)
+
+
+def documents():
+    """(rowid, текст, post_id) всех постов и комментариев."""
+    posts = Post.objects.order_by().values_list('pk', 'text', 'pk')
+    for pk, text, post_id in posts.iterator():
+        yield post_rowid(pk), text, post_id
+    comments = Comment.objects.order_by().values_list('pk', 'text', 'post_id')
+    for pk, text, post_id in comments.iterator():
+        yield comment_rowid(pk), text, post_id
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Перестраивает индекс пачками; возвращает число документов."""
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for document in documents():
+            batch.append(document)
+            if len(batch) == batch_size:
+                total += insert_batch(cursor, batch)
+                batch = []
+        total += insert_batch(cursor, batch)
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def insert_batch(cursor, batch):
+    if batch:
+        stems = stem_texts(text for _, text, _ in batch)
+        cursor.executemany(INSERT, [
+            [rowid, text, stemmed, post_id]
+            for (rowid, text, post_id), stemmed in zip(batch, stems)
+        ])
+    return len(batch)
+
+
+def query_stems(query):
+    return [stem(word) for word in WORD.findall(query.lower())]
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение FTS5 по основам слов: все слова
+    обязательны, последнее ищется по префиксу - его могут ещё допечатывать.
+    Операторы FTS5 из ввода не проходят."""
+    stems = query_stems(query)
+    if not stems:
+        return None
+    terms = [f'"{word}"' for word in stems]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(hit_score, rowid):
+    raw = json.dumps([hit_score, rowid]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        hit_score, rowid = json.loads(raw.decode())
+        return float(hit_score), int(rowid)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def snippet(text, stems):
+    """Фрагмент текста вокруг первого найденного слова, слова запроса
+    выделены <mark>. Текст экранируется, разметка из поста не проходит."""
+    words = list(WORD.finditer(text))
+    if not words:
+        return ''
+    *exact, prefix = stems
+    exact = set(exact)
+    matched = [
+        index for index, word in enumerate(words)
+        if stem(word.group()) in exact
+        or stem(word.group()).startswith(prefix)
+    ]
+    first = max(0, (matched[0] if matched else 0) - SNIPPET_WORDS // 4)
+    window = words[first:first + SNIPPET_WORDS]
+    start = window[0].start() if first else 0
+    end = window[-1].end() if first + SNIPPET_WORDS < len(words) else None
+    parts = ['…' if first else '']
+    position = start
+    for index, word in enumerate(window, first):
+        if index in matched:
+            parts.append(escape(text[position:word.start()]))
+            parts.append(f'<mark>{escape(word.group())}</mark>')
+            position = word.end()
+    parts.append(escape(text[position:end]))
+    parts.append('…' if end is not None else '')
+    return mark_safe(''.join(parts))
+
+
+def matching_post_ids(query):
+    """id постов, в тексте которых или в комментариях к которым
+    есть все слова запроса."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT DISTINCT post_id FROM {TABLE} WHERE {TABLE} MATCH %s',
+            [expression],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def text_matches(query):
+    """Подзапрос id постов, в тексте которых есть все слова запроса, для
+    pk__in: id не выгружаются в Python, комментарии не учитываются.
+    None, если в запросе нет слов."""
+    expression = match_expression(query)
+    if expression is None:
+        return None
+    # rowid документа самого поста - post_rowid(post_id).
+    return RawSQL(
+        f'SELECT post_id FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND rowid = 2 * post_id',
+        [expression],
+    )
+
+
+def search(query, cursor=None, limit=RESULTS_PER_PAGE):
+    """Документы по убыванию релевантности (bm25) и курсор следующей
+    страницы. Страницы отсчитываются от ключа (score, rowid) последнего
+    документа, а не через OFFSET."""
+    expression = match_expression(query)
+    if expression is None:
+        return [], None
+    after = decode_cursor(cursor) if cursor else (float('-inf'), -1)
+    # bm25() отрицателен: чем меньше, тем документ релевантнее.
+    with connection.cursor() as db:
+        db.execute(
+            f'SELECT rowid, post_id, score, body FROM ('
+            f'  SELECT rowid, post_id, bm25({TABLE}) AS score, body'
+            f'  FROM {TABLE} WHERE {TABLE} MATCH %s'
+            f') WHERE score > %s OR (score = %s AND rowid > %s)'
+            f' ORDER BY score, rowid LIMIT %s',
+            [expression, after[0], after[0], after[1], limit + 1],
+        )
+        rows = db.fetchall()
+    stems = query_stems(query)
+    posts = Post.objects.feed().in_bulk({row[1] for row in rows})
+    hits = [
+        Hit(
+            post=posts[post_id],
+            comment_id=rowid // 2 if rowid % 2 else None,
+            score=score,
+            snippet=snippet(body, stems),
+        )
+        for rowid, post_id, score, body in rows[:limit]
+        if post_id in posts
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[2], last[0])
+    return hits, next_cursor
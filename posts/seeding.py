@@ -0,0 +1,167 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Распределения похожи на настоящую соцсеть: подписчиков и записей у
+авторов по закону Ципфа (немного звёзд и длинный хвост), свежие записи
+комментируют чаще старых, длина текстов - логнормальная. Строки
+генерируются лениво и вставляются пачками, поэтому память не растёт с
+числом строк; id берутся из непрерывных диапазонов, а не из списков.
+"""
+import math
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max, Min
+
+from .models import Comment, Follow, Group, Post, User
+
+# Доли от общего числа строк.
+SHARES = {
+    'users': 0.05,
+    'groups': 0.001,
+    'posts': 0.4,
+    'comments': 0.35,
+    'follows': 0.2,
+}
+BATCH_SIZE = 1000
+# Показатели степени: чем больше, тем сильнее перекос к первым местам.
+FOLLOWERS_EXPONENT = 1.0
+FOLLOWING_EXPONENT = 0.6
+POSTS_EXPONENT = 0.9
+GROUPS_EXPONENT = 1.1
+COMMENTS_EXPONENT = 1.0
+GROUP_SHARE = 0.7
+
+BASES = (
+    'запис дневник автор подписчик сообществ картинк комментари лент '
+    'страниц пользовател друз собак кошк город работ утр вечер книг '
+    'фильм музык погод дорог мор гор проект код сервер баз'
+).split()
+ENDINGS = ('', 'а', 'у', 'ом', 'ами', 'ах', 'ов', 'и', 'ей', 'ям', 'е', 'ы')
+FILLER = 'и в на с по для не что как это был очень новый'.split()
+
+
+def plan(rows):
+    """Сколько строк каждого вида нужно для rows строк всего."""
+    return {kind: max(1, int(rows * share)) for kind, share in SHARES.items()}
+
+
+def make_text(rng, words):
+    return ' '.join(
+        rng.choice(BASES) + rng.choice(ENDINGS)
+        if rng.random() < 0.6 else rng.choice(FILLER)
+        for _ in range(words)
+    )
+
+
+def text_length(rng):
+    return max(1, min(400, int(rng.lognormvariate(3, 0.8))))
+
+
+def zipf_rank(rng, count, exponent):
+    """Место от 0 до count - 1, вероятность места r убывает как
+    1 / (r + 1) ** exponent. Обратная функция непрерывного
+    распределения: ни весов, ни списков в памяти."""
+    u = rng.random()
+    if exponent == 1:
+        x = (count + 1) ** u
+    else:
+        power = 1 - exponent
+        x = (((count + 1) ** power - 1) * u + 1) ** (1 / power)
+    return min(int(x) - 1, count - 1)
+
+
+def scatter(count):
+    """Перестановка мест по id: шаг, взаимно простой с count, разносит
+    популярных пользователей по всему диапазону."""
+    step = int(count * 0.618) | 1
+    while math.gcd(step, count) != 1:
+        step += 2
+    return lambda rank: rank * step % count
+
+
+def id_space(queryset):
+    """id строк как range, если они идут подряд, иначе списком."""
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    count = queryset.count()
+    if bounds['first'] is not None and (
+            bounds['last'] - bounds['first'] + 1 == count):
+        return range(bounds['first'], bounds['last'] + 1)
+    return list(queryset.order_by('pk').values_list('pk', flat=True))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Seeder:
+    def __init__(self, rng, prefix, now, days):
+        self.rng = rng
+        self.prefix = prefix
+        self.now = now
+        self.span = timedelta(days=days)
+        self.password = make_password(None)
+
+    def users(self, count):
+        for number in range(count):
+            yield User(username=f'{self.prefix}{number}',
+                       password=self.password)
+
+    def groups(self, count):
+        for number in range(count):
+            slug = f'{self.prefix}{number}'
+            yield Group(title=f'Сообщество {number}', slug=slug,
+                        description=make_text(self.rng, 20))
+
+    def post_time(self, index, count):
+        # Записи идут по времени в порядке id, как при обычной работе.
+        return self.now - self.span + self.span * (index + 0.5) / count
+
+    def posts(self, count, users, groups):
+        author_at = scatter(len(users))
+        group_at = scatter(len(groups)) if groups else None
+        for index in range(count):
+            author = users[author_at(
+                zipf_rank(self.rng, len(users), POSTS_EXPONENT))]
+            group = None
+            if group_at is not None and self.rng.random() < GROUP_SHARE:
+                group = groups[group_at(
+                    zipf_rank(self.rng, len(groups), GROUPS_EXPONENT))]
+            pub_date = self.post_time(index, count)
+            yield Post(
+                author_id=author, group_id=group, pub_date=pub_date,
+                updated=pub_date,
+                text=make_text(self.rng, text_length(self.rng)),
+            )
+
+    def comments(self, count, users, posts):
+        for _ in range(count):
+            # Место 0 - самая свежая запись.
+            index = len(posts) - 1 - zipf_rank(
+                self.rng, len(posts), COMMENTS_EXPONENT)
+            delay = timedelta(hours=self.rng.expovariate(1 / 6))
+            created = min(self.post_time(index, len(posts)) + delay,
+                          self.now)
+            yield Comment(
+                post_id=posts[index],
+                author_id=users[self.rng.randrange(len(users))],
+                created=created,
+                text=make_text(self.rng, max(1, text_length(self.rng) // 3)),
+            )
+
+    def follows(self, count, users):
+        # Те же места, что у авторов записей: пишущих больше читают
+        # больше. Активные читатели берутся с другого конца перестановки.
+        place = scatter(len(users))
+        for _ in range(count):
+            author = users[place(
+                zipf_rank(self.rng, len(users), FOLLOWERS_EXPONENT))]
+            reader = users[len(users) - 1 - place(
+                zipf_rank(self.rng, len(users), FOLLOWING_EXPONENT))]
+            if reader != author:
+                yield Follow(user_id=reader, author_id=author)
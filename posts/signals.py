@@ -0,0 +1,192 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .feed_cache import bump, post_scopes
+from . import search
+from .jobs import enqueue
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .storage import media_storage
+from .timelines import backfill_timeline, fan_out_post, prune_timeline
+from .variants import release_variants
+
+
+def bump_stats(user_id, **deltas):
+    with transaction.atomic():
+        AuthorStats.objects.get_or_create(user_id=user_id)
+        AuthorStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+
+
+def drop_stats(user_id, **deltas):
+    # Строку не создаём: при каскадном удалении пользователя
+    # его статистика может быть уже удалена. Счётчик может отставать
+    # от строк (bulk_create не шлёт post_save), и уход ниже нуля
+    # нарушил бы CHECK положительного поля и сорвал удаление.
+    AuthorStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) - delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def loaded_post(comment):
+    """Пост комментария, если он загружен вместе с автором и группой
+    (так делает posts.write_buffer), иначе None."""
+    if not Comment.post.is_cached(comment):
+        return None
+    post = comment.post
+    if Post.author.is_cached(post) and (
+            post.group_id is None or Post.group.is_cached(post)):
+        return post
+    return None
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    drop_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        with transaction.atomic():
+            bump_stats(instance.author_id, followers_count=1)
+            bump_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill_timeline(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    with transaction.atomic():
+        drop_stats(instance.author_id, followers_count=1)
+        drop_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_prune(sender, instance, **kwargs):
+    prune_timeline(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, raw=False, **kwargs):
+    # Новая загрузка ещё не записана: хранилище учтёт на неё ссылку,
+    # даже если её байты совпадут с прежней картинкой.
+    instance._image_uploaded = bool(
+        instance.image) and not instance.image._committed
+    if instance.pk is not None and not raw:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group__slug', 'image').first()
+        if previous is not None:
+            (instance._previous_group_slug,
+             instance._previous_image) = previous
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous and not raw:
+        if previous != instance.image.name:
+            media_storage.release(previous)
+            # Миниатюры старой картинки удаляются в фоне.
+            enqueue('collect_media', name=previous)
+        elif getattr(instance, '_image_uploaded', False):
+            # Те же байты загружены заново: у поста по-прежнему одна
+            # ссылка на файл.
+            media_storage.release(previous)
+    instance._previous_image = instance.image.name
+    instance._image_uploaded = False
+
+
+@receiver(post_delete, sender=Post)
+def release_post_media(sender, instance, **kwargs):
+    if instance.image:
+        media_storage.release(instance.image.name)
+        enqueue('collect_media', name=instance.image.name)
+    release_variants(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_group_slug', None)
+    bump(*post_scopes(instance, [previous]))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, raw=False, **kwargs):
+    # В лентах выводится число комментариев к посту.
+    post = loaded_post(instance) or Post.objects.select_related(
+        'author', 'group').filter(pk=instance.post_id).first()
+    if post is not None and not raw:
+        bump(*post_scopes(post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        usernames = User.objects.filter(
+            pk__in=[instance.user_id, instance.author_id],
+        ).values_list('username', flat=True)
+        bump(*(f'author:{username}' for username in usernames))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump(f'group:{instance.slug}', 'groups')
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Картинки и их варианты сохраняются с update_fields без текста:
+    # индексировать нечего.
+    if raw or (update_fields is not None and 'text' not in update_fields):
+        return
+    search.index_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_comment(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_documents(search.post_rowid(instance.pk))
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_documents(search.comment_rowid(instance.pk))
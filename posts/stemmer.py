@@ -0,0 +1,88 @@
+"""Токенизация и стемминг русского текста для поиска.
+
+Стеммер - алгоритм Портера для русского языка (вариант Snowball без
+словарей), чистый Python без внешних зависимостей. Слова латиницей
+и числа только приводятся к нижнему регистру.
+"""
+import re
+from functools import lru_cache
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+VOWEL_SPLIT = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'(ив|ивши|ившись|ыв|ывши|ывшись|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+    r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+I_ENDING = re.compile(r'и$')
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SOFT_SIGN = re.compile(r'ь$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+DOUBLE_N = re.compile(r'нн$')
+
+# Слов в языке немного, а встречаются они по закону Ципфа: кэш
+# делает повторный стемминг частых слов бесплатным.
+CACHE_SIZE = 100000
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC.search(word):
+        return word
+    match = VOWEL_SPLIT.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            if stripped == rv:
+                rv = NOUN.sub('', rv, 1)
+            else:
+                rv = stripped
+    else:
+        rv = stripped
+    rv = I_ENDING.sub('', rv, 1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_ENDING.sub('', rv, 1)
+    stripped = SOFT_SIGN.sub('', rv, 1)
+    if stripped == rv:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        rv = DOUBLE_N.sub('н', rv, 1)
+    else:
+        rv = stripped
+    return start + rv
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in tokenize(text))
+
+
+def stem_texts(texts):
+    """Стеммит пачку текстов: каждое уникальное слово пачки
+    обрабатывается один раз, дальше - подстановка из словаря."""
+    tokenized = [tokenize(text) for text in texts]
+    stems = {word: stem(word) for word in set().union(*tokenized)}
+    return [' '.join(map(stems.__getitem__, words)) for words in tokenized]
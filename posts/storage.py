@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, f'{digest}{extension}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла - хэш его содержимого.
+
+    Одинаковые загрузки получают одно имя и хранятся одним файлом,
+    число ссылок на файл ведётся в MediaFile. Владелец файла вызывает
+    release() вместо delete().
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content_hash(content))
+        media_file = apps.get_model('posts', 'MediaFile')
+        with transaction.atomic():
+            _, created = media_file.objects.get_or_create(
+                name=name, defaults={'size': content.size})
+            if not created:
+                media_file.objects.filter(name=name).update(
+                    refs=F('refs') + 1)
+        # Ссылка учтена до записи файла, чтобы параллельный release()
+        # не удалил его между проверкой и записью; если запись не
+        # удалась, ссылка снимается.
+        temporary = None
+        try:
+            if not self.exists(name):
+                # Пишем во временный файл и переименовываем: параллельная
+                # загрузка тех же байтов не увидит недописанный файл.
+                temporary = super().save(f'{name}.part', content)
+                os.replace(self.path(temporary), self.path(name))
+        except BaseException:
+            if temporary is not None:
+                self.delete(temporary)
+            self.release(name)
+            raise
+        return name
+
+    def add_refs(self, refs):
+        """Учитывает ссылки на файлы, записанные в обход save(), например
+        при импорте: refs - словарь {имя: число ссылок}."""
+        media_file = apps.get_model('posts', 'MediaFile')
+        with transaction.atomic():
+            existing = set(media_file.objects.filter(
+                name__in=refs).values_list('name', flat=True))
+            for name in existing:
+                media_file.objects.filter(name=name).update(
+                    refs=F('refs') + refs[name])
+            media_file.objects.bulk_create(
+                media_file(
+                    name=name,
+                    refs=count,
+                    size=self.size(name) if self.exists(name) else 0,
+                )
+                for name, count in refs.items() if name not in existing
+            )
+
+    def release(self, name):
+        """Снимает одну ссылку на файл и удаляет его, если ссылок
+        не осталось. Файлы, которые хранилище не сохраняло, не трогает."""
+        media_file = apps.get_model('posts', 'MediaFile')
+        with transaction.atomic():
+            if media_file.objects.filter(name=name, refs__gt=1).update(
+                    refs=F('refs') - 1):
+                return
+            deleted, _ = media_file.objects.filter(name=name).delete()
+        if deleted:
+            self.delete(name)
+
+
+media_storage = ContentAddressedStorage()
@@ -1,20 +1,58 @@
+import io
+import json
+import multiprocessing
 import os
 import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
-from django.urls import reverse
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.template import base
+from django.template.loader import get_template
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default as sorl_default
+from sorl.thumbnail.images import ImageFile
 
+from yatube import metrics, replicas, slow_queries
+from yatube.cache import SQLiteCache
+from yatube.sqlite.base import DatabaseWrapper
 from yatube.settings import BASE_DIR
 
-from .models import Comment, Follow, Group, Post, User
+from . import (benchmarks, images, index_advisor, jobs, jsonl, paginators,
+               search, stemmer, threads, variants, views, write_buffer)
+from .feed_cache import (bump, cache_feed, changed_at, get_versions,
+                         version_key)
+from .models import (COMMENT_MAX_DEPTH, AuthorStats, Comment, Follow, Group,
+                     Job, MediaFile, Post, PostQuerySet, TimelineEntry, User)
+from .storage import media_storage
+from .thumbnails import generate_thumbnail
 
 TEST_MEDIA_ROOT = os.path.join(BASE_DIR, 'test_data')
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
 
 @override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
-class TestAll(TestCase):
+class TestAll(TransactionTestCase):
     def setUp(self):
         self.auth_client = Client()
         self.unauth_client = Client()
@@ -175,14 +213,9 @@ class TestAll(TestCase):
         self.assertEqual(response.status_code, 404)
 
     def test_img_appears_everywhere(self):
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
-            b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
-            b'\x02\x4c\x01\x00\x3b'
-        )
         img = SimpleUploadedFile(
             name='img.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/jpeg',
         )
         post = Post.objects.create(
@@ -202,6 +235,37 @@ class TestAll(TestCase):
                 response = self.unauth_client.get(url)
                 self.assertContains(response, '<img')
 
+    def test_thumbnail_generated_by_job_after_upload(self):
+        img = SimpleUploadedFile(
+            name='img.gif',
+            content=SMALL_GIF,
+            content_type='image/gif',
+        )
+        self.auth_client.post(
+            reverse('new_post'),
+            {'text': 'post with image', 'image': img},
+        )
+        response = self.unauth_client.get(reverse('index'))
+        self.assertContains(response, 'Картинка обрабатывается')
+        call_command(
+            'run_jobs', '--once', '--processes=0', stdout=io.StringIO())
+        post = Post.objects.get()
+        self.assertFalse(post.image_processing)
+        self.assertEqual(
+            (post.thumbnail_width, post.thumbnail_height), (960, 339))
+        response = self.unauth_client.get(reverse('index'))
+        self.assertContains(response, f'src="{post.thumbnail.url}"')
+
+    def test_generate_thumbnails_command(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='post with image',
+            image=SimpleUploadedFile('img.gif', SMALL_GIF, 'image/gif'),
+        )
+        call_command('generate_thumbnails', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail)
+
     def test_not_img_cannot_upload(self):
         text_file = (b'text')
         not_img = SimpleUploadedFile(
@@ -239,18 +303,51 @@ class TestAll(TestCase):
             user=self.user,
             group=self.group
         )
-        post.delete()
-        response_after_post_delete = self.unauth_client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response_from_cache = self.unauth_client.get(reverse('index'))
         self.assertEqual(
             response_before_post_delete.content,
-            response_after_post_delete.content
+            response_from_cache.content
         )
-        cache.clear()
-        response_after_cache_clear = self.unauth_client.get(reverse('index'))
-        self.assertNotEqual(
-            response_before_post_delete.content,
-            response_after_cache_clear.content
+        post.delete()
+        response_after_post_delete = self.unauth_client.get(reverse('index'))
+        self.assertNotContains(response_after_post_delete, self.post_text)
+
+    def test_cache_invalidated_by_comment_and_group_change(self):
+        post = Post.objects.create(
+            text=self.post_text,
+            author=self.user,
+            group=self.group,
         )
+        self.unauth_client.get(self.group_link())
+        Comment.objects.create(post=post, author=self.user, text='каммент')
+        for url in (reverse('index'), self.profile_link(), self.group_link()):
+            with self.subTest(url=url):
+                response = self.unauth_client.get(url)
+                self.assertContains(response, '1 комментариев')
+        post.group = None
+        post.save()
+        response = self.unauth_client.get(self.group_link())
+        self.assertNotContains(response, self.post_text)
+
+    def test_feed_rendered_before_commit_is_not_kept(self):
+        feed = PostQuerySet.feed
+        with transaction.atomic():
+            post = Post.objects.create(text=self.post_text, author=self.user)
+            # Запрос из другого соединения до фиксации поста не видит
+            # и кладёт ленту в кэш.
+            with mock.patch.object(
+                    PostQuerySet, 'feed',
+                    lambda self: feed(self).exclude(pk=post.pk)):
+                response = self.unauth_client.get(reverse('index'))
+            self.assertNotContains(response, self.post_text)
+            committed_at = time.time()
+        # Версия сменилась при фиксации: эта лента больше не находится,
+        # а копия базы, снятая до фиксации, для неё слишком стара.
+        [version] = get_versions(['index'])
+        self.assertGreaterEqual(changed_at(version), committed_at)
+        response = self.unauth_client.get(reverse('index'))
+        self.assertContains(response, self.post_text)
 
     def test_auth_user_can_follow(self):
         user2 = User.objects.create_user(username='bishop')
@@ -328,3 +425,1410 @@ class TestAll(TestCase):
         comment_text = 'каммент'
         self.unauth_client.post(add_comment_link, {'text': comment_text})
         self.assertFalse(Comment.objects.exists())
+
+
+class TestFeedQueries(TestCase):
+    POSTS_COUNT = 10
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='ripley')
+        self.author = User.objects.create_user(username='bishop')
+        self.group = Group.objects.create(
+            title='Чужие',
+            slug='aliens',
+            description='Группа посвящённая проблемам с ксеноморфами',
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        for number in range(self.POSTS_COUNT):
+            post = Post.objects.create(
+                text=f'Пост номер {number}',
+                author=self.author,
+                group=self.group,
+            )
+            Comment.objects.create(post=post, author=self.user, text='раз')
+            Comment.objects.create(post=post, author=self.user, text='два')
+        cache.clear()
+
+    def test_index_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, '2 комментариев', self.POSTS_COUNT)
+
+    def test_group_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('group', args=[self.group.slug]))
+        self.assertContains(response, '2 комментариев', self.POSTS_COUNT)
+
+    def test_profile_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('profile', args=[self.author.username]))
+        self.assertContains(response, '2 комментариев', self.POSTS_COUNT)
+
+    def test_follow_index_queries(self):
+        self.client.force_login(self.user)
+        # Сессия, пользователь, авторы, чья лента собирается при чтении,
+        # число записей первых страниц и сама страница.
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('follow_index'))
+        self.assertContains(response, '2 комментариев', self.POSTS_COUNT)
+
+
+class TestConditionalGet(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='ripley')
+        self.author = User.objects.create_user(username='bishop')
+        self.group = Group.objects.create(
+            title='Чужие', slug='aliens', description='Ксеноморфы')
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group)
+
+    def urls(self):
+        return [
+            reverse('index'),
+            reverse('group', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+            reverse('post', args=[self.author.username, self.post.pk]),
+        ]
+
+    def test_not_modified_skips_view(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                self.assertTrue(response.has_header('Last-Modified'))
+                # Страница из кэша лент ответила бы и без вью: кэш
+                # очищается, а версии областей, из которых собран ETag,
+                # остаются.
+                keys = [version_key(scope) for scope in (
+                    'index', f'group:{self.group.slug}',
+                    f'author:{self.author.username}')]
+                versions = cache.get_many(keys)
+                cache.clear()
+                cache.set_many(versions, None)
+                with mock.patch('posts.views.render') as render:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                render.assert_not_called()
+                self.assertEqual(response.status_code, 304)
+
+    def test_cached_page_revalidates_without_queries(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_etag(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls()}
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        etag = self.client.get(self.urls()[2])['ETag']
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(self.urls()[2], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_per_user(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TestAuthorStats(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ripley')
+        self.author = User.objects.create_user(username='bishop')
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_posts_and_subscriptions(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        Post.objects.create(text='Ещё пост', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        post.delete()
+        Follow.objects.filter(user=self.user).delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_deleting_user_keeps_other_counters(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Пост', author=self.author)
+        self.author.delete()
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_counters_do_not_go_below_zero(self):
+        Post.objects.bulk_create([Post(text='Пост', author=self.author)])
+        Post.objects.get(author=self.author).delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_rebuild_command(self):
+        Post.objects.create(text='Пост', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        AuthorStats.objects.update(
+            posts_count=10, followers_count=10, following_count=10)
+        call_command('rebuild_author_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.author).following_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+
+    def test_profile_card_shows_counters(self):
+        Post.objects.create(text='Пост', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(
+            reverse('profile', args=[self.author.username]))
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Записей: 1')
+
+
+class TestCursorPagination(TestCase):
+    POSTS_COUNT = 25
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='bishop')
+        for number in range(self.POSTS_COUNT):
+            Post.objects.create(
+                text=f'Пост номер {number}', author=self.author)
+        # Одинаковое время публикации у половины постов проверяет,
+        # что ключ (pub_date, id) не теряет и не повторяет записи.
+        oldest = Post.objects.order_by('pk')[:self.POSTS_COUNT // 2]
+        Post.objects.filter(pk__in=list(oldest.values_list('pk', flat=True)))\
+            .update(pub_date=oldest[0].pub_date)
+        self.expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)
+        )
+        cache.clear()
+
+    def get_page(self, cursor):
+        response = self.client.get(reverse('index'), {'cursor': cursor})
+        return response.context['page']
+
+    def test_walk_older_and_newer(self):
+        page = self.get_page('')
+        pages = [page]
+        while page.has_next():
+            page = self.get_page(page.next_cursor())
+            pages.append(page)
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = [post.pk for post in pages[-1]]
+        while page.has_previous():
+            page = self.get_page(page.previous_cursor())
+            back = [post.pk for post in page] + back
+        self.assertEqual(back, self.expected)
+
+    def test_no_count_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('index'), {'cursor': ''})
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = self.get_page('не-курсор')
+        self.assertEqual([post.pk for post in page], self.expected[:10])
+
+    @mock.patch.object(paginators, 'SHALLOW_PAGES', 2)
+    def test_numbered_pages_lead_into_cursor(self):
+        response = self.client.get(reverse('index'), {'page': 2})
+        paginator = response.context['paginator']
+        page = response.context['page']
+        self.assertEqual(list(paginator.page_range), [1, 2])
+        self.assertEqual([post.pk for post in page], self.expected[10:20])
+        self.assertContains(response, f'?cursor={paginator.next_cursor}')
+        page = self.get_page(paginator.next_cursor)
+        self.assertEqual([post.pk for post in page], self.expected[20:])
+
+    @mock.patch.object(paginators, 'SHALLOW_PAGES', 2)
+    def test_count_is_bounded(self):
+        with self.assertNumQueries(2) as context:
+            self.client.get(reverse('index'))
+        [count] = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('SELECT COUNT(*)')]
+        self.assertIn('LIMIT 21', count)
+
+
+class TestTimelines(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='ripley')
+        self.author = User.objects.create_user(username='bishop')
+        self.client.force_login(self.user)
+
+    def follow_page_texts(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_new_post_is_fanned_out(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertEqual(self.follow_page_texts(), ['Новый пост'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        Post.objects.create(text='Старый пост', author=self.author)
+        self.client.get(
+            reverse('profile_follow', args=[self.author.username]))
+        self.assertEqual(self.follow_page_texts(), ['Старый пост'])
+        self.client.get(
+            reverse('profile_unfollow', args=[self.author.username]))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page_texts(), [])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_is_read_at_request_time(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Пост для всех', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertTrue(
+            AuthorStats.objects.get(user=self.author).fanout_on_read)
+        self.assertEqual(self.follow_page_texts(), ['Пост для всех'])
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Пост', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=io.StringIO())
+        self.assertEqual(self.follow_page_texts(), ['Пост'])
+
+    @mock.patch.object(paginators, 'SHALLOW_PAGES', 1)
+    def test_pages_merge_timeline_and_read_time_authors(self):
+        popular = User.objects.create_user(username='ash')
+        AuthorStats.objects.filter(user=popular).update(fanout_on_read=True)
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=popular)
+        for number in range(25):
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=popular if number % 3 else self.author,
+            )
+        response = self.client.get(reverse('follow_index'))
+        texts = [post.text for post in response.context['page']]
+        cursor = response.context['paginator'].next_cursor
+        while cursor:
+            with self.assertNumQueries(4) as context:
+                response = self.client.get(
+                    reverse('follow_index'), {'cursor': cursor})
+            # Каждый источник ленты читается не дальше одной страницы.
+            self.assertEqual(
+                context.captured_queries[-1]['sql'].count('LIMIT 11'), 3)
+            texts += [post.text for post in response.context['page']]
+            cursor = response.context['page'].next_cursor()
+        self.assertEqual(
+            texts, [f'Пост {number}' for number in range(24, -1, -1)])
+
+
+def set_in_child_process(cache, key, value):
+    cache.set(key, value)
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_get_set_add_delete(self):
+        cache = self.make_cache()
+        cache.set('key', {'value': 1})
+        self.assertEqual(cache.get('key'), {'value': 1})
+        self.assertFalse(cache.add('key', 'other'))
+        self.assertTrue(cache.add('new', 'value'))
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('new'), 'value')
+
+    def test_expired_value_is_not_returned(self):
+        cache = self.make_cache()
+        cache.set('key', 'value', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key', 'fresh'))
+
+    def test_least_recently_used_evicted_over_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=3500, CULL_FREQUENCY=3)
+        cache.set('old', b'x' * 1000)
+        time.sleep(1.1)
+        cache.set('second', b'x' * 1000)
+        cache.set('third', b'x' * 1000)
+        cache.get('old')
+        cache.set('fourth', b'x' * 1000)
+        self.assertIsNotNone(cache.get('old'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('fourth'))
+
+    def test_shared_between_processes(self):
+        cache = self.make_cache()
+        cache.get('warm-up')
+        process = multiprocessing.get_context('fork').Process(
+            target=set_in_child_process, args=(cache, 'key', 'from child'))
+        process.start()
+        process.join()
+        self.assertEqual(cache.get('key'), 'from child')
+
+
+class TestFeedCacheSingleFlight(TestCase):
+    def test_cold_page_is_computed_once(self):
+        calls = []
+
+        @cache_feed('single-flight')
+        def slow_view(request):
+            calls.append(1)
+            time.sleep(0.3)
+            return HttpResponse('страница')
+
+        cache.clear()
+        factory = RequestFactory()
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(
+                    slow_view(factory.get('/slow/'))))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            [response.content for response in responses],
+            ['страница'.encode()] * 5,
+        )
+
+
+class TestPostCardCache(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='bishop')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.post = Post.objects.create(
+            text='Исходный текст', author=self.author)
+        cache.clear()
+
+    def profile_link(self):
+        return reverse('profile', args=[self.author.username])
+
+    def test_edit_link_not_shared_through_cached_card(self):
+        response = self.author_client.get(self.profile_link())
+        self.assertContains(response, 'Редактировать')
+        response = self.client.get(self.profile_link())
+        self.assertContains(response, 'Исходный текст')
+        self.assertNotContains(response, 'Редактировать')
+
+    def test_edited_post_card_is_rendered_again(self):
+        self.client.get(self.profile_link())
+        self.author_client.post(
+            reverse('post_edit', args=[self.author.username, self.post.id]),
+            {'text': 'Новый текст'},
+        )
+        response = self.client.get(self.profile_link())
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Исходный текст')
+
+    def test_renamed_group_card_is_rendered_again(self):
+        group = Group.objects.create(title='Ностромо', slug='nostromo')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        link = reverse('group', args=[group.slug])
+        self.client.get(link)
+        group.title = 'Сулако'
+        group.save()
+        response = self.client.get(link)
+        self.assertContains(response, '#Сулако')
+        self.assertNotContains(response, '#Ностромо')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestJobs(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ripley')
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def jpeg_with_exif(self):
+        image = Image.new('RGB', (40, 20), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        exif[0x010f] = 'Camera maker'
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), 'image/jpeg')
+
+    def test_image_job_strips_exif_and_rotates(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=self.jpeg_with_exif(),
+            image_processing=True,
+        )
+        job = jobs.enqueue('process_post_image', post_id=post.pk)
+        self.assertEqual(jobs.claim('test', 10), [job.pk])
+        self.assertTrue(jobs.run_job(job.pk))
+        post.refresh_from_db()
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertNotIn('exif', image.info)
+        self.assertTrue(post.thumbnail)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_image_job_creates_variants_for_srcset(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'blue').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=SimpleUploadedFile('big.png', buffer.getvalue()),
+        )
+        images.process_post_image(post.pk)
+        post.refresh_from_db()
+        saved = variants.load_variants(post)
+        formats = {f for f, _, _ in variants.available_formats()}
+        self.assertIn('webp', formats)
+        self.assertEqual(
+            {(v['format'], v['width'], v['height']) for v in saved},
+            {(f, w, round(w * 339 / 960))
+             for f in formats for w in (320, 640, 960)},
+        )
+        for variant in saved:
+            with media_storage.open(variant['name']) as file:
+                with Image.open(file) as image:
+                    self.assertEqual(image.format, variant['format'].upper())
+        response = Client().get(reverse('index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '.webp 640w')
+
+        client = Client()
+        client.force_login(self.user)
+        client.post(
+            reverse('post_edit', args=[self.user.username, post.pk]),
+            {'text': 'Без фото', 'image-clear': 'on'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(variants.load_variants(post), [])
+        for variant in saved:
+            self.assertFalse(media_storage.exists(variant['name']))
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        post = Post.objects.create(
+            author=self.user, text='Фото', image_processing=True)
+        job = Job.objects.create(
+            kind='process_post_image',
+            payload=json.dumps({'post_id': post.pk}),
+            max_attempts=2,
+        )
+        with mock.patch(
+                'posts.images.process_post_image', side_effect=OSError):
+            jobs.claim('test', 1)
+            self.assertFalse(jobs.run_job(job.pk))
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.PENDING)
+            self.assertIn('OSError', job.last_error)
+            self.assertEqual(jobs.claim('test', 1), [])
+            Job.objects.update(run_after=job.created)
+            jobs.claim('test', 1)
+            self.assertFalse(jobs.run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        post.refresh_from_db()
+        self.assertFalse(post.image_processing)
+
+    def test_failed_image_clears_cached_placeholder(self):
+        cache.clear()
+        post = Post.objects.create(
+            author=self.user, text='Фото', image_processing=True)
+        for url in (reverse('index'),
+                    reverse('profile', args=[self.user.username])):
+            self.assertContains(
+                self.client.get(url), 'Картинка обрабатывается')
+        images.post_image_failed(post.pk)
+        for url in (reverse('index'),
+                    reverse('profile', args=[self.user.username])):
+            self.assertNotContains(
+                self.client.get(url), 'Картинка обрабатывается')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TestMediaStorage(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ripley')
+        # Хранилище ключей sorl кэширует записи между тестами.
+        cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=SimpleUploadedFile(filename, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_post('img.gif')
+        second = self.create_post('copy.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(os.listdir(os.path.join(TEST_MEDIA_ROOT, 'posts')),
+                         [os.path.basename(first.image.name)])
+        self.assertEqual(MediaFile.objects.get().refs, 2)
+        first.delete()
+        self.assertTrue(media_storage.exists(second.image.name))
+        self.assertEqual(MediaFile.objects.get().refs, 1)
+        second.delete()
+        self.assertFalse(media_storage.exists(second.image.name))
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_same_upload_keeps_one_ref(self):
+        post = self.create_post('img.gif')
+        for _ in range(2):
+            post.image = SimpleUploadedFile('again.gif', SMALL_GIF)
+            post.save()
+        self.assertEqual(MediaFile.objects.get().refs, 1)
+        post.delete()
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_failed_write_releases_ref(self):
+        with mock.patch('posts.storage.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                media_storage.save('posts/img.gif', io.BytesIO(SMALL_GIF))
+        self.assertFalse(MediaFile.objects.exists())
+        self.assertEqual(media_storage.listdir('posts')[1], [])
+
+    def test_dedupe_media_command(self):
+        directory = os.path.join(TEST_MEDIA_ROOT, 'posts')
+        os.makedirs(directory)
+        for filename in ('image.gif', 'image_3Mlu30c.gif', 'unused.gif'):
+            with open(os.path.join(directory, filename), 'wb') as file:
+                file.write(SMALL_GIF)
+        first = self.create_post('img.gif')
+        second = self.create_post('img.gif')
+        Post.objects.filter(pk=first.pk).update(image='posts/image.gif')
+        Post.objects.filter(pk=second.pk).update(
+            image='posts/image_3Mlu30c.gif')
+        MediaFile.objects.all().delete()
+        call_command('dedupe_media', stdout=io.StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(media_storage.listdir('posts')[1],
+                         [os.path.basename(first.image.name)])
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).refs, 2)
+        self.assertTrue(first.thumbnail)
+
+    def post_with_thumbnail(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), color).save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=SimpleUploadedFile('img.png', buffer.getvalue()),
+        )
+        generate_thumbnail(post)
+        return post
+
+    def test_gc_media_removes_orphans(self):
+        live = self.post_with_thumbnail('red')
+        dead = self.post_with_thumbnail('blue')
+        Post.objects.filter(pk=dead.pk).delete()
+        media_storage.save('posts/old.png', io.BytesIO(b'old'))
+        MediaFile.objects.filter(name__startswith='posts/').exclude(
+            name=live.image.name).delete()
+        out = io.StringIO()
+        call_command('gc_media', '--dry-run', '--min-age=0', stdout=out)
+        self.assertIn('Можно удалить файлов: 2', out.getvalue())
+        self.assertTrue(media_storage.exists(dead.thumbnail.name))
+        call_command('gc_media', '--min-age=0', stdout=io.StringIO())
+        self.assertFalse(media_storage.exists(dead.thumbnail.name))
+        self.assertEqual(media_storage.listdir('posts')[1],
+                         [os.path.basename(live.image.name)])
+        self.assertTrue(media_storage.exists(live.thumbnail.name))
+        self.assertIsNone(sorl_default.kvstore.get(
+            ImageFile(dead.image.name, media_storage)))
+
+    def test_thumbnails_collected_after_post_delete(self):
+        post = self.post_with_thumbnail('red')
+        post.delete()
+        self.assertTrue(media_storage.exists(post.thumbnail.name))
+        call_command(
+            'run_jobs', '--once', '--processes=0', stdout=io.StringIO())
+        self.assertFalse(media_storage.exists(post.thumbnail.name))
+        self.assertFalse(media_storage.exists(post.image.name))
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='ripley')
+        self.post = Post.objects.create(
+            author=self.user, text='Ксеноморф на борту <b>Ностромо</b>')
+        self.other = Post.objects.create(
+            author=self.user, text='Андроид Эш работает на компанию')
+
+    def test_search_posts_and_comments(self):
+        Comment.objects.create(
+            post=self.other, author=self.user, text='Эш спасал ксеноморфа')
+        response = self.client.get(reverse('search'), {'q': 'ксеноморф'})
+        hits = response.context['hits']
+        self.assertEqual(
+            {(hit.post, hit.comment_id is None) for hit in hits},
+            {(self.post, True), (self.other, False)},
+        )
+        self.assertContains(response, '<mark>Ксеноморф</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_user_named_search_has_profile(self):
+        User.objects.create_user(username='search')
+        response = self.client.get(reverse('profile', args=['search']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            resolve(reverse('search')).func, views.search)
+
+    def test_image_save_does_not_reindex(self):
+        with mock.patch.object(search, 'index_post') as index_post:
+            self.post.save(update_fields=['image', 'updated'])
+            index_post.assert_not_called()
+            self.post.save(update_fields=['text'])
+            index_post.assert_called_once_with(self.post)
+
+    def test_inflected_forms_match(self):
+        Comment.objects.create(
+            post=self.other, author=self.user, text='Эш спасал ксеноморфа')
+        ids = search.matching_post_ids('ксеноморфами')
+        self.assertEqual(set(ids), {self.post.pk, self.other.pk})
+        self.assertEqual(search.matching_post_ids('андроидов компании'),
+                         [self.other.pk])
+        hits, _ = search.search('борт')
+        self.assertIn('на <mark>борту</mark>', hits[0].snippet)
+
+    def test_admin_searches_post_text_only(self):
+        Comment.objects.create(
+            post=self.other, author=self.user, text='Эш спасал ксеноморфа')
+        admin = User.objects.create_superuser(
+            username='burke', email='burke@example.com', password='x')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'ксеноморф'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post])
+        self.assertTrue(any(
+            f'(SELECT post_id FROM {search.TABLE} ' in query['sql']
+            for query in context.captured_queries))
+
+    def test_batch_stemming_matches_single(self):
+        texts = ['Красивые книги', 'книгой и ёлками', '', 'Django 2.2']
+        self.assertEqual(
+            stemmer.stem_texts(texts),
+            [stemmer.stem_text(text) for text in texts],
+        )
+        self.assertEqual(stemmer.stem_texts(texts)[1], 'книг и елк')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Чужой'
+        self.post.save()
+        self.assertEqual(search.search('ксеноморф')[0], [])
+        self.assertEqual(search.matching_post_ids('чужой'), [self.post.pk])
+        self.post.delete()
+        self.assertEqual(search.matching_post_ids('чужой'), [])
+
+    def test_keyset_pagination(self):
+        for number in range(25):
+            Post.objects.create(
+                author=self.user, text='экипаж ' * (number % 4 + 1))
+        seen = []
+        hits, cursor = search.search('экипаж', limit=10)
+        while True:
+            seen.extend(hit.post.pk for hit in hits)
+            if cursor is None:
+                break
+            hits, cursor = search.search('экипаж', cursor, limit=10)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_query_syntax_is_not_passed_to_fts(self):
+        response = self.client.get(reverse('search'), {'q': 'AND "('})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('search'), {'q': 'эш', 'after': 'мусор'})
+        self.assertEqual(len(response.context['hits']), 1)
+
+
+class TestJsonl(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='dallas')
+        self.reader = User.objects.create_user(username='lambert')
+        self.group = Group.objects.create(
+            title='Экипаж', slug='crew', description='Ностромо')
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Сигнал бедствия')
+        Post.objects.filter(pk=self.post.pk).update(
+            pub_date='2019-01-02T03:04:05Z')
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Это предупреждение')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_round_trip(self):
+        path = os.path.join(tempfile.mkdtemp(), 'dump.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_jsonl', path, stderr=io.StringIO())
+        with open(path, encoding='utf-8') as dump:
+            kinds = [json.loads(line)['type'] for line in dump]
+        self.assertEqual(kinds, ['group', 'post', 'comment', 'follow'])
+        pub_date = Post.objects.get().pub_date
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        call_command('import_jsonl', path, batch_size=1,
+                     stdout=io.StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.pk, self.post.pk)
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.group.slug, 'crew')
+        self.assertEqual(post.comments.get().author.username, 'lambert')
+        self.assertTrue(Follow.objects.filter(
+            user__username='lambert', author__username='dallas').exists())
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(post.author.stats.posts_count, 1)
+        self.assertEqual(post.author.stats.followers_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user__username='lambert', post=post, pub_date=pub_date).exists())
+        self.assertEqual(search.matching_post_ids('предупреждения'),
+                         [post.pk])
+
+    @mock.patch.object(jsonl, 'DATES_BATCH_SIZE', 1)
+    def test_import_extends_stats_and_timelines(self):
+        entry = TimelineEntry.objects.get(user=self.reader, post=self.post)
+        lines = [json.dumps(record) for record in (
+            {'type': 'post', 'id': 100, 'author': 'dallas', 'text': 'Ответ',
+             'pub_date': '2019-01-03T03:04:05Z'},
+            {'type': 'post', 'id': 101, 'author': 'ash', 'text': 'Приказ',
+             'pub_date': '2019-01-04T03:04:05Z'},
+            {'type': 'follow', 'user': 'parker', 'author': 'dallas'},
+            {'type': 'follow', 'user': 'lambert', 'author': 'dallas'},
+        )]
+        list(jsonl.import_lines(lines))
+        pub_date = Post._meta.get_field('pub_date')
+        self.assertTrue(pub_date.auto_now_add)
+        self.assertEqual(
+            list(Post.objects.filter(pk__in=[100, 101]).order_by(
+                'pk').values_list('pub_date', 'updated')),
+            [(pub_date.to_python(f'2019-01-0{day}T03:04:05Z'),) * 2
+             for day in (3, 4)])
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (2, 2))
+        # Ленты дополнены, а не собраны заново.
+        self.assertTrue(TimelineEntry.objects.filter(pk=entry.pk).exists())
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list(
+                'user__username', 'post_id')),
+            {('lambert', self.post.pk), ('lambert', 100),
+             ('parker', self.post.pk), ('parker', 100)},
+        )
+
+    def test_invalid_record(self):
+        with self.assertRaises(jsonl.InvalidRecord):
+            list(jsonl.import_lines(['{"type": "user"}']))
+
+    def test_comments_without_post_are_skipped(self):
+        lines = [json.dumps(record) for record in (
+            {'type': 'comment', 'id': 100, 'post': 999, 'author': 'ash',
+             'text': 'Никому', 'created': '2019-01-02T03:04:05Z'},
+            {'type': 'comment', 'id': 101, 'post': 999, 'author': 'ash',
+             'text': 'Ответ', 'created': '2019-01-02T03:04:05Z',
+             'parent': 100},
+            {'type': 'comment', 'id': 102, 'post': self.post.pk,
+             'author': 'ash', 'text': 'Дошёл',
+             'created': '2019-01-02T03:04:05Z'},
+        )]
+        self.assertEqual(
+            list(jsonl.import_lines(lines)), [('comment', 3, 2)])
+        self.assertEqual(
+            list(Comment.objects.filter(author__username='ash').values_list(
+                'text', flat=True)),
+            ['Дошёл'])
+
+    def test_imported_images_are_counted(self):
+        record = {
+            'type': 'post', 'author': 'ash', 'text': 'Фото',
+            'pub_date': '2019-01-02T03:04:05Z', 'image': 'posts/cat.gif',
+        }
+        lines = [json.dumps({**record, 'id': pk}) for pk in (100, 101)]
+        list(jsonl.import_lines(lines))
+        list(jsonl.import_lines(lines))
+        self.assertEqual(MediaFile.objects.get(name='posts/cat.gif').refs, 2)
+
+
+class TestBenchmarks(TestCase):
+    def test_seed_and_bench(self):
+        call_command('seed_data', rows=2000, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 100)
+        self.assertEqual(Post.objects.count(), 800)
+        # Даты записей разнесены на год назад, а не проставлены вставкой.
+        self.assertLess(
+            Post.objects.earliest('pub_date').pub_date,
+            timezone.now() - timedelta(days=300))
+        followers = sorted(AuthorStats.objects.values_list(
+            'followers_count', flat=True), reverse=True)
+        # Степенной закон: у первого подписчиков намного больше медианы.
+        self.assertGreater(followers[0], 5 * followers[len(followers) // 2])
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'result.json')
+        call_command('bench_views', requests=2, warmup=0, output=path,
+                     stdout=io.StringIO())
+        result = benchmarks.load(path)
+        self.assertEqual(result['dataset']['post'], 800)
+        self.assertLessEqual(
+            set(benchmarks.url_names()),
+            {name.split()[0] for name in result['views']},
+        )
+        self.assertEqual(result['views']['index']['status'], 200)
+        self.assertEqual(Post.objects.count(), 800)
+
+    def test_compare(self):
+        view = {'p50': 10.0, 'queries': 4}
+        baseline = {'views': {'index': view, 'post': view}}
+        current = {'views': {
+            'index': {'p50': 11.0, 'queries': 4},
+            'post': {'p50': 10.0, 'queries': 5},
+        }}
+        self.assertEqual(
+            [row[-1] for row in benchmarks.compare(baseline, current)],
+            [False, True],
+        )
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='parker')
+        Post.objects.create(author=self.user, text='Проверка двигателя')
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_records_by_url_name(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.get('/no-such/page/')
+        report = metrics.registry.report()
+        self.assertEqual(report['index']['count'], 2)
+        self.assertGreater(report['index']['queries']['max'], 0)
+        self.assertGreater(report['index']['template_ms']['max'], 0)
+        self.assertGreaterEqual(report['index']['total_ms']['max'],
+                                report['index']['db_ms']['max'])
+        self.assertEqual(report[metrics.UNRESOLVED]['count'], 1)
+        # Время шаблонов считает бэкенд, сам Template не подменяется.
+        self.assertEqual(
+            base.Template.render.__module__, 'django.template.base')
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        self.client.get(reverse('index'))
+        self.assertEqual(metrics.registry.report(), {})
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_report_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('index'))
+        data = self.client.get(reverse('metrics')).json()
+        self.assertEqual(data['views']['index']['count'], 1)
+        self.client.post(reverse('metrics'))
+        self.assertEqual(list(metrics.registry.report()), ['metrics'])
+
+    def test_histogram_percentiles(self):
+        histogram = metrics.Histogram(metrics.TIME_BUCKETS)
+        for value in [3] * 90 + [150] * 9 + [9000]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 5)
+        self.assertEqual(histogram.percentile(99), 200)
+        self.assertEqual(histogram.percentile(100), 9000)
+
+
+class TestSlowQueries(TestCase):
+    def setUp(self):
+        cache.clear()
+        slow_queries.log.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='kane', is_staff=True)
+        self.post = Post.objects.create(author=self.user, text='Яйцо')
+        for text in ('Первый', 'Второй'):
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=text)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            slow_queries.fingerprint(
+                "SELECT * FROM t WHERE a IN (1, 2, 3) AND b = 'x'"),
+            slow_queries.fingerprint(
+                'SELECT * FROM t  WHERE a IN (%s, %s) AND b = %s'),
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_logs_view_template_and_plan(self):
+        with self.assertLogs('yatube.slow_queries', 'WARNING'):
+            self.client.get(reverse('post', args=['kane', self.post.pk]))
+        entries = slow_queries.log.report()
+        self.assertEqual(
+            {view for entry in entries for view in entry['views']}, {'post'})
+        [comments] = [
+            entry for entry in entries
+            if entry['sql'].startswith('SELECT "posts_comment"."id"')
+        ]
+        # Комментарии с авторами - одним запросом со страницы ветки.
+        self.assertEqual(comments['count'], 1)
+        [location] = comments['locations']
+        self.assertRegex(location, r'^posts/threads\.py:\d+ comment_page$')
+        plans = [entry['plan'] for entry in entries if entry['plan']]
+        self.assertTrue(any('SCAN' in line or 'SEARCH' in line
+                            for plan in plans for line in plan))
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('slow_queries')).json()
+        self.assertEqual(data['threshold_ms'], 0)
+
+    def test_template_origin(self):
+        recorder = slow_queries.Recorder(RequestFactory().get('/'), 0)
+        with connection.execute_wrapper(recorder):
+            get_template('parts/comment_items.html').render(
+                {'post': self.post, 'comments': Comment.objects.all()})
+        templates = Counter()
+        for entry in slow_queries.log.report():
+            templates.update(entry['templates'])
+        # Без select_related автор каждого комментария - свой запрос.
+        self.assertEqual(templates['parts/comment_items.html'], 3)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        self.client.get(reverse('post', args=['kane', self.post.pk]))
+        self.assertEqual(slow_queries.log.report(), [])
+
+
+class TestCommentThreads(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='ash')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Образец')
+        self.first = self.comment('Первый')
+        self.second = self.comment('Второй')
+        self.reply = self.comment('Ответ', parent=self.first)
+        self.nested = self.comment('Ответ на ответ', parent=self.reply)
+
+    def comment(self, text, parent=None, post=None):
+        return Comment.objects.create(
+            post=post or self.post, author=self.user, text=text,
+            parent=parent)
+
+    def url(self, name):
+        return reverse(name, args=['ash', self.post.pk])
+
+    def test_thread_order(self):
+        comments, next_after = threads.comment_page(self.post.pk)
+        self.assertEqual(
+            [(comment.text, comment.depth) for comment in comments],
+            [('Первый', 0), ('Ответ', 1), ('Ответ на ответ', 2),
+             ('Второй', 0)],
+        )
+        self.assertIsNone(next_after)
+        data = self.client.get(
+            self.url('post_comments'),
+            {'root': self.reply.pk, 'format': 'json'},
+        ).json()
+        self.assertEqual([item['id'] for item in data['comments']],
+                         [self.reply.pk, self.nested.pk])
+
+    def test_keyset_pages(self):
+        comments, next_after = threads.comment_page(self.post.pk, limit=2)
+        self.assertEqual(list(comments), [self.first, self.reply])
+        response = self.client.get(
+            self.url('post_comments'), {'after': next_after})
+        self.assertEqual(list(response.context['comments']),
+                         [self.nested, self.second])
+        self.assertIsNone(response.context['next_after'])
+
+    def test_post_page_shows_first_page(self):
+        for number in range(threads.COMMENTS_PER_PAGE):
+            self.comment(f'Комментарий {number}')
+        response = self.client.get(self.url('post'))
+        self.assertEqual(
+            len(response.context['comments']), threads.COMMENTS_PER_PAGE)
+        self.assertContains(response, 'Показать ещё комментарии')
+        self.assertNotContains(response, 'Комментарий 49')
+
+    def test_reply_only_within_post(self):
+        other = Post.objects.create(author=self.user, text='Другой')
+        foreign = self.comment('Чужой', post=other)
+        self.client.post(self.url('add_comment'),
+                         {'text': 'Ответ тут', 'parent': self.second.pk})
+        self.client.post(self.url('add_comment'),
+                         {'text': 'Ответ туда', 'parent': foreign.pk})
+        self.assertEqual(
+            Comment.objects.get(text='Ответ тут').parent, self.second)
+        self.assertIsNone(Comment.objects.get(text='Ответ туда').parent)
+
+    def test_depth_is_capped(self):
+        parent = self.nested
+        for number in range(COMMENT_MAX_DEPTH):
+            parent = self.comment(f'Глубже {number}', parent=parent)
+        self.assertEqual(parent.depth, COMMENT_MAX_DEPTH - 1)
+        self.assertLessEqual(len(parent.path), 250)
+
+    def test_failed_path_rolls_back_insert(self):
+        with mock.patch.object(Comment, 'make_path', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.comment('Без пути')
+        self.assertFalse(Comment.objects.filter(text='Без пути').exists())
+
+
+class TestIndexAdvisor(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='dallas')
+        self.group = Group.objects.create(
+            title='Ностромо', slug='nostromo', description='Буксир')
+        for number in range(3):
+            Post.objects.create(text=f'Рейс {number}', author=self.author,
+                                group=self.group)
+
+    def test_issues(self):
+        plan = [
+            'CO-ROUTINE subquery',
+            '  SCAN subquery',
+            'SCAN posts_post',
+            'SCAN posts_search VIRTUAL TABLE INDEX 0:',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(index_advisor.issues(plan, min_rows=3), [
+            'полный просмотр posts_post',
+            'временное B-дерево для ORDER BY',
+        ])
+        # Маленькую таблицу просмотреть дешевле, чем читать индекс.
+        self.assertEqual(index_advisor.issues(plan, min_rows=4), [
+            'временное B-дерево для ORDER BY',
+        ])
+
+    def test_multi_index_or_sort(self):
+        plan = [
+            'MULTI-INDEX OR',
+            '  INDEX 1',
+            '    SEARCH posts_post USING INTEGER PRIMARY KEY (rowid=?)',
+            '  INDEX 2',
+            '    SEARCH posts_post USING INDEX post_author_pub_date_idx '
+            '(author_id=?)',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(index_advisor.issues(plan), [
+            'временное B-дерево для ORDER BY объединения ветвей '
+            'MULTI-INDEX OR',
+        ])
+
+    def test_suggest(self):
+        sql = str(Post.objects.filter(group=self.group).order_by(
+            '-pub_date', '-pk').query)
+        self.assertEqual(index_advisor.suggest(sql),
+                         'posts_post (group_id, pub_date, id)')
+        self.assertIsNone(index_advisor.suggest('SELECT 1'))
+
+    def test_feed_count_skips_comment_count(self):
+        posts = Post.objects.filter(group=self.group).feed()
+        with self.assertNumQueries(1) as context:
+            self.assertEqual(posts.count(), 3)
+        self.assertNotIn('posts_comment', context.captured_queries[0]['sql'])
+
+    def test_feed_pages_read_by_index(self):
+        queries = index_advisor.replay(benchmarks.cases())
+        findings = index_advisor.analyze(queries, min_rows=0)
+        views = {view for finding in findings
+                 for view in finding.query.views}
+        self.assertNotIn('group', views)
+        self.assertNotIn('profile', views)
+
+
+class TestSQLiteBackend(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'db.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def wrapper(self, **options):
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': self.path,
+             'OPTIONS': options},
+            'tuning',
+        )
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.wrapper()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -65536)
+
+    def test_options_override_pragmas(self):
+        wrapper = self.wrapper(
+            pragmas={'busy_timeout': 100, 'synchronous': None})
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 100)
+        # FULL - значение SQLite по умолчанию.
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)
+
+    def test_transactions_take_write_lock(self):
+        wrapper = self.wrapper()
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        # Ещё ничего не записано, но второй писатель уже ждёт.
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.rollback()
+        wrapper.set_autocommit(True)
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+    def test_unknown_transaction_mode(self):
+        wrapper = self.wrapper(transaction_mode='LAZY')
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True)
+
+
+class TestReplicas(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        # В тестах копия - зеркало основной базы, а оно не читается.
+        for patcher in (
+            mock.patch.dict(connections[replicas.REPLICA].settings_dict,
+                            NAME='file:replica.sqlite3?mode=ro'),
+            mock.patch.object(replicas, 'snapshot_time', return_value=100),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def route(self, path, method='get', cookies=None, scope=None,
+              write=False):
+        """База, из которой вью по адресу path читало бы записи,
+        и ответ."""
+        request = getattr(self.factory, method)(path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(request.path_info)
+        chosen = []
+
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            chosen.append(router.db_for_read(Post))
+            return HttpResponse()
+
+        if scope is not None:
+            view = cache_feed(scope)(view)
+
+        def handler(request):
+            return (middleware.process_view(request, view, (), {})
+                    or view(request))
+
+        middleware = replicas.ReplicaMiddleware(handler)
+        response = middleware(request)
+        return chosen[0], response
+
+    def test_refresh(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'db.sqlite3')
+            target = os.path.join(directory, 'replica', 'db.sqlite3')
+            with sqlite3.connect(source) as origin:
+                origin.execute('PRAGMA journal_mode = WAL')
+                origin.execute('CREATE TABLE post (text TEXT)')
+                origin.execute("INSERT INTO post VALUES ('Ностромо')")
+            origin.close()
+            started = replicas.refresh(source, target)
+            self.assertEqual(os.stat(target).st_mtime, started)
+            copy = sqlite3.connect(f'file:{target}?mode=ro', uri=True)
+            self.addCleanup(copy.close)
+            self.assertEqual(
+                copy.execute('SELECT COUNT(*) FROM post').fetchone(), (1,))
+            self.assertEqual(
+                copy.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+
+    def test_feed_pages_read_from_replica(self):
+        self.assertEqual(self.route('/')[0], replicas.REPLICA)
+        self.assertEqual(self.route('/', 'post')[0], 'default')
+        self.assertEqual(self.route(reverse('follow_index'))[0], 'default')
+
+    def test_primary_mirror_is_not_a_replica(self):
+        with mock.patch.dict(
+                connections[replicas.REPLICA].settings_dict,
+                NAME=connection.settings_dict['NAME']):
+            self.assertEqual(self.route('/')[0], 'default')
+
+    def test_writer_reads_own_writes(self):
+        _, response = self.route('/', 'post', write=True)
+        wrote_at = response.cookies[replicas.COOKIE].value
+        self.assertGreater(float(wrote_at), 100)
+        self.assertEqual(
+            self.route('/', cookies={replicas.COOKIE: wrote_at})[0],
+            'default')
+        self.assertEqual(
+            self.route('/', cookies={replicas.COOKIE: '99'})[0],
+            replicas.REPLICA)
+        self.assertNotIn(replicas.COOKIE, self.route('/')[1].cookies)
+
+    def test_feed_cache_needs_snapshot_after_bump(self):
+        bump('index')
+        self.assertEqual(self.route('/', scope='index')[0], 'default')
+        replicas.snapshot_time.return_value = time.time() + 60
+        self.assertEqual(
+            self.route('/?page=2', scope='index')[0], replicas.REPLICA)
+
+    def test_post_page_needs_snapshot_after_new_post(self):
+        # Пост другого автора создан после снимка 100: из копии страница
+        # не открылась бы, а чтение из неё упало бы - файла копии нет.
+        author = User.objects.create_user(username='dallas')
+        post = Post.objects.create(author=author, text='Сигнал')
+        response = Client().get(
+            reverse('post', args=[author.username, post.pk]))
+        self.assertContains(response, 'Сигнал')
+
+    def test_new_post_sets_cookie(self):
+        client = Client()
+        client.force_login(User.objects.create_user(username='parker'))
+        response = client.post(reverse('new_post'), {'text': 'Кот Джонс'})
+        self.assertIn(replicas.COOKIE, response.cookies)
+
+
+class TestWriteBuffer(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='lambert')
+        self.author = User.objects.create_user(username='ash')
+        self.post = Post.objects.create(author=self.author, text='Маяк')
+        self.parent = Comment.objects.create(
+            post=self.post, author=self.reader, text='Кто здесь?')
+
+    def flush(self, *instances):
+        entries = [
+            write_buffer.Entry(instance, 'default') for instance in instances]
+        write_buffer.buffer.flush(entries)
+        return entries
+
+    def test_comments_in_one_batch(self):
+        version = get_versions(['index'])
+        entries = self.flush(
+            Comment(post=self.post, author=self.author, text='Я'),
+            Comment(post=self.post, author=self.reader, text='Ответ',
+                    parent=self.parent),
+        )
+        top, reply = [entry.instance for entry in entries]
+        self.assertEqual([entry.error for entry in entries], [None, None])
+        self.assertEqual(
+            Comment.objects.get(pk=top.pk).path, top.make_path())
+        self.assertTrue(Comment.objects.get(
+            pk=reply.pk).path.startswith(self.parent.path))
+        # post_save сработал: лента сброшена, комментарий в поиске.
+        self.assertNotEqual(get_versions(['index']), version)
+        hits, _ = search.search('Ответ')
+        self.assertEqual([hit.comment_id for hit in hits], [reply.pk])
+
+    def test_follows_like_get_or_create(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='brett')
+        self.flush(
+            Follow(user=self.reader, author=self.author),
+            Follow(user=other, author=self.author),
+            Follow(user=other, author=self.author),
+        )
+        self.assertEqual(Follow.objects.filter(author=self.author).count(), 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 2)
+
+    def test_saved_rows_are_not_adding(self):
+        comment, follow = [entry.instance for entry in self.flush(
+            Comment(post=self.post, author=self.author, text='Я'),
+            Follow(user=self.reader, author=self.author),
+        )]
+        for instance in (comment, follow):
+            self.assertFalse(instance._state.adding)
+            self.assertEqual(instance._state.db, 'default')
+
+    def test_large_follow_batch(self):
+        User.objects.bulk_create(
+            User(username=f'crew{number}') for number in range(1500))
+        users = User.objects.filter(username__startswith='crew')
+        # Пачкой, а не по одной после ошибки.
+        write_buffer.write([
+            write_buffer.Entry(Follow(user_id=pk, author=self.author),
+                               'default')
+            for pk in users.values_list('pk', flat=True)
+        ], 'default')
+        self.assertEqual(
+            Follow.objects.filter(author=self.author).count(), 1500)
+
+    def test_failed_row_does_not_fail_batch(self):
+        good, bad = self.flush(
+            Comment(post=self.post, author=self.author, text='Я'),
+            Comment(post=self.post, author=self.author, text=None),
+        )
+        self.assertIsNone(good.error)
+        self.assertTrue(Comment.objects.filter(pk=good.instance.pk).exists())
+        self.assertIsNotNone(bad.error)
+
+    @override_settings(WRITE_BUFFER_DELAY_MS=200)
+    def test_concurrent_saves_share_a_batch(self):
+        batches = []
+
+        def write(entries, using):
+            batches.append(len(entries))
+
+        saved = []
+        threads = [
+            threading.Thread(target=lambda: saved.append(write_buffer.save(
+                Follow(user=self.reader, author=self.author))))
+            for _ in range(5)
+        ]
+        with mock.patch.object(write_buffer, 'write', write):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(batches, [5])
+        self.assertEqual(len(saved), 5)
+
+    @override_settings(WRITE_BUFFER_DELAY_MS=200)
+    def test_saves_inside_transaction_directly(self):
+        comment = write_buffer.save(
+            Comment(post=self.post, author=self.author, text='Я'))
+        self.assertEqual(Comment.objects.get(pk=comment.pk).path,
+                         comment.make_path())
@@ -0,0 +1,58 @@
+"""Ветки комментариев на материализованном пути.
+
+Сортировка по Comment.path - обход дерева в глубину: ответы идут сразу
+за комментарием, на который отвечают, в порядке написания. Поэтому и
+страница комментариев поста, и вся ветка одного комментария - диапазон
+индекса (post, path), а следующая страница начинается после path
+последнего комментария предыдущей.
+"""
+import re
+
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+
+from .models import COMMENT_PATH_LENGTH, COMMENT_PATH_WIDTH, Comment
+
+COMMENTS_PER_PAGE = 50
+# Символ сразу после '9': все пути ветки меньше path + END.
+END = ';'
+PATH = re.compile(rf'(?:\d{{{COMMENT_PATH_WIDTH}}})+')
+
+
+def top_level_path():
+    """Путь комментария без родителя как выражение базы - для строк,
+    вставленных bulk_create, у которых id появился только в базе."""
+    return LPad(Cast('pk', CharField()), COMMENT_PATH_WIDTH, Value('0'))
+
+
+def fill_paths(queryset=None):
+    queryset = Comment.objects.all() if queryset is None else queryset
+    return queryset.filter(path='', parent=None).update(
+        path=top_level_path())
+
+
+def is_valid_path(value):
+    return (
+        len(value) <= COMMENT_PATH_LENGTH
+        and PATH.fullmatch(value) is not None
+    )
+
+
+def comment_page(post_id, after=None, root=None, limit=COMMENTS_PER_PAGE):
+    """Комментарии поста или ветки root после пути after (вычисленный
+    QuerySet) и путь для следующей страницы, если она есть."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author')
+    if root is not None:
+        comments = comments.filter(
+            path__gte=root.path, path__lt=root.path + END)
+    if after:
+        comments = comments.filter(path__gt=after)
+    page = comments.order_by('path')[:limit]
+    items = list(page)
+    next_after = None
+    # Есть ли что-то дальше - только для полной страницы.
+    if len(items) == limit and comments.filter(
+            path__gt=items[-1].path).exists():
+        next_after = items[-1].path
+    return page, next_after
@@ -0,0 +1,20 @@
+from sorl.thumbnail import get_thumbnail
+
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def generate_thumbnail(post):
+    if post.image:
+        thumbnail = get_thumbnail(
+            post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS)
+        post.thumbnail = thumbnail.name
+        post.thumbnail_width = thumbnail.width
+        post.thumbnail_height = thumbnail.height
+    else:
+        post.thumbnail = None
+        post.thumbnail_width = None
+        post.thumbnail_height = None
+    post.save(update_fields=[
+        'thumbnail', 'thumbnail_width', 'thumbnail_height', 'updated',
+    ])
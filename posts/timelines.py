@@ -0,0 +1,139 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginators import POSTS_PER_PAGE, CursorPaginator, keyset
+
+BATCH_SIZE = 500
+
+
+def is_fanout_on_read(author_id):
+    """Раз перейдя порог, автор остаётся в режиме сборки при чтении:
+    иначе записи, не разложенные по лентам, из них бы пропали."""
+    stats = AuthorStats.objects.filter(user_id=author_id).first()
+    if stats is None:
+        return False
+    if stats.fanout_on_read:
+        return True
+    if (stats.followers_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+            or stats.posts_count > settings.TIMELINE_FANOUT_MAX_POSTS):
+        AuthorStats.objects.filter(user_id=author_id).update(
+            fanout_on_read=True)
+        return True
+    return False
+
+
+def fan_out_post(post):
+    if is_fanout_on_read(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post=post,
+                           pub_date=post.pub_date)
+             for user_id in followers.iterator()),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def backfill_timeline(follow):
+    if is_fanout_on_read(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id).values_list('pk', 'pub_date')
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=follow.user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in posts.iterator()),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def fan_out_posts(post_ids):
+    """fan_out_post для постов, вставленных bulk_create."""
+    rows = Post.objects.filter(
+        pk__in=post_ids, author__following__isnull=False,
+    ).exclude(
+        author__stats__fanout_on_read=True,
+    ).values_list('author__following__user_id', 'pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for user_id, post_id, pub_date in rows.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_timelines(pairs):
+    """backfill_timeline для подписок (user_id, author_id), вставленных
+    bulk_create."""
+    followers = defaultdict(list)
+    for user_id, author_id in pairs:
+        followers[author_id].append(user_id)
+    posts = Post.objects.filter(
+        author_id__in=followers,
+    ).exclude(
+        author__stats__fanout_on_read=True,
+    ).values_list('author_id', 'pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for author_id, post_id, pub_date in posts.iterator()
+         for user_id in followers[author_id]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune_timeline(follow):
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id).delete()
+
+
+def read_time_authors(user):
+    return list(Follow.objects.filter(
+        user=user, author__stats__fanout_on_read=True,
+    ).values_list('author_id', flat=True))
+
+
+def timeline_filter(user, authors, limit, direction=None, value=None,
+                    pk=None):
+    """Записи ленты user за ключом (value, pk), не больше limit из каждого
+    источника: разложенных записей - по индексу (user, -pub_date, -post),
+    записей каждого автора из authors - по индексу (author, pub_date, id).
+    Страница собирается из этих строк, а не из всей ленты."""
+    materialized = keyset(
+        TimelineEntry.objects.filter(user=user),
+        direction, value, pk, pk_field='post_id',
+    )
+    condition = Q(pk__in=materialized.values('post_id')[:limit])
+    for author_id in authors:
+        posts = keyset(
+            Post.objects.filter(author_id=author_id), direction, value, pk)
+        condition |= Q(pk__in=posts.values('pk')[:limit])
+    return condition
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок user: каждое окно выбирается по ключу из её
+    источников (см. timeline_filter)."""
+
+    def __init__(self, user, per_page=POSTS_PER_PAGE):
+        super().__init__(Post.objects.feed(), per_page)
+        self.user = user
+
+    @cached_property
+    def authors(self):
+        return read_time_authors(self.user)
+
+    def window(self, direction=None, value=None, pk=None, limit=None):
+        posts = self.object_list.filter(timeline_filter(
+            self.user, self.authors, limit, direction, value, pk))
+        return keyset(posts, direction, field=self.field)[:limit]
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .storage import media_storage
+
+try:
+    # AVIF поддерживается Pillow только через плагин.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+VARIANT_WIDTHS = (320, 640, 960)
+# Пропорции совпадают с миниатюрой 960x339, чтобы карточка не прыгала.
+VARIANT_RATIO = 339 / 960
+VARIANTS_DIR = 'posts/variants'
+# Сначала более компактный формат: браузер берёт первый подходящий source.
+FORMATS = (
+    ('avif', 'image/avif', {'quality': 50, 'speed': 6}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+)
+
+
+def available_formats():
+    # Image.SAVE заполняется плагинами лениво: до первого открытия
+    # картинки в нём может не быть WebP.
+    Image.init()
+    return [item for item in FORMATS if item[0].upper() in Image.SAVE]
+
+
+def variant_widths(width):
+    """Ширины, не превышающие ширину оригинала; самая узкая есть всегда."""
+    widths = [w for w in VARIANT_WIDTHS if w <= width]
+    return widths or VARIANT_WIDTHS[:1]
+
+
+def release_variants(post):
+    for variant in load_variants(post):
+        media_storage.release(variant['name'])
+
+
+def load_variants(post):
+    return json.loads(post.image_variants or '[]')
+
+
+def generate_variants(post):
+    """Сохраняет уменьшенные копии картинки поста в современных форматах
+    рядом с оригиналом и записывает их список в post.image_variants."""
+    release_variants(post)
+    variants = []
+    if post.image:
+        stem = os.path.splitext(os.path.basename(post.image.name))[0]
+        with Image.open(post.image) as image:
+            if getattr(image, 'is_animated', False):
+                # Анимацию сохраняет только оригинал.
+                image = None
+            else:
+                image = ImageOps.exif_transpose(image)
+        if image is not None:
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            for width in variant_widths(image.width):
+                height = round(width * VARIANT_RATIO)
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                for extension, _, options in available_formats():
+                    buffer = io.BytesIO()
+                    resized.save(buffer, extension.upper(), **options)
+                    name = media_storage.save(
+                        f'{VARIANTS_DIR}/{stem}-{width}w.{extension}',
+                        ContentFile(buffer.getvalue()),
+                    )
+                    variants.append({
+                        'name': name,
+                        'format': extension,
+                        'width': width,
+                        'height': height,
+                    })
+    post.image_variants = json.dumps(variants)
+    post.save(update_fields=['image_variants', 'updated'])
+
+
+def sources(post):
+    """Список (MIME-тип, srcset) для тегов <source> в <picture>."""
+    variants = load_variants(post)
+    result = []
+    for extension, mime_type, _ in FORMATS:
+        srcset = ', '.join(
+            f'{media_storage.url(v["name"])} {v["width"]}w'
+            for v in variants if v['format'] == extension
+        )
+        if srcset:
+            result.append((mime_type, srcset))
+    return result
@@ -1,18 +1,30 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page  # noqa
 
+from . import write_buffer
+from .conditional import conditional_page, feed_validators
+from .feed_cache import cache_feed, fresh_feed
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .jobs import enqueue
+from .models import Comment, Follow, Group, Post, User
+from .paginators import paginate
+from .search import InvalidCursor, search as search_posts
+from .threads import comment_page, is_valid_path
+from .thumbnails import generate_thumbnail
+from .timelines import TimelinePaginator
+from .variants import generate_variants
 
 
-@cache_page(20, key_prefix="index_page")
+def index_validators(request):
+    return feed_validators(request, 'index')
+
+
+@cache_feed('index')
+@conditional_page(index_validators)
 def index(request):
-    post_list = Post.objects.select_related('group', 'author').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.feed()
+    paginator, page = paginate(request, post_list)
     return render(
         request,
         'index.html',
@@ -20,12 +32,16 @@ def index(request):
     )
 
 
+def group_validators(request, slug):
+    return feed_validators(request, f'group:{slug}')
+
+
+@cache_feed('group:{slug}')
+@conditional_page(group_validators)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_post_list = group.posts.select_related('group', 'author').all()
-    paginator = Paginator(group_post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group_post_list = group.posts.feed()
+    paginator, page = paginate(request, group_post_list)
     return render(
         request,
         'group.html',
@@ -41,7 +57,10 @@ def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None,)
     if form.is_valid():
         form.instance.author = request.user
-        form.save()
+        form.instance.image_processing = bool(form.instance.image)
+        post = form.save()
+        if post.image:
+            enqueue('process_post_image', post_id=post.pk)
         return redirect('index')
     return render(
         request,
@@ -50,17 +69,22 @@ def new_post(request):
     )
 
 
+def profile_validators(request, username):
+    return feed_validators(request, f'author:{username}')
+
+
+@cache_feed('author:{username}')
+@conditional_page(profile_validators)
 def profile(request, username):
-    profile = get_object_or_404(User, username=username)
-    profile_post_list = profile.posts.all()
+    profile = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    profile_post_list = profile.posts.feed()
     try:
         follow = Follow.objects.filter(
             user=request.user, author=profile).exists()
     except TypeError:
         follow = True
-    paginator = Paginator(profile_post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, profile_post_list)
     return render(
         request,
         'profile.html',
@@ -73,18 +97,45 @@ def profile(request, username):
     )
 
 
+def post_validators(request, username, post_id):
+    # Комментарии и подписки меняют версию области автора.
+    return feed_validators(request, f'author:{username}')
+
+
+def comments_after(request):
+    after = request.GET.get('after', '')
+    return after if is_valid_path(after) else None
+
+
+def save_comment(request, form, post):
+    form.instance.author = request.user
+    form.instance.post = post
+    # Ответ можно дать только на комментарий того же поста.
+    parent_id = request.POST.get('parent', '')
+    if parent_id.isdigit():
+        form.instance.parent = Comment.objects.filter(
+            post=post, pk=parent_id).first()
+    return write_buffer.save(form.instance)
+
+
+@fresh_feed('author:{username}')
+@conditional_page(post_validators)
 def post_view(request, username, post_id):
     post = get_object_or_404(
-        Post.objects.prefetch_related('comments'),
+        Post.objects.feed().select_related('author__stats'),
         author__username=username,
         pk=post_id
     )
+    reply = request.GET.get('reply', '')
+    reply_to = None
+    if reply.isdigit():
+        reply_to = Comment.objects.filter(
+            post=post, pk=reply).select_related('author').first()
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        form.instance.author = request.user
-        form.instance.post = post
-        form.save()
+        save_comment(request, form, post)
         return redirect('post', username=username, post_id=post_id)
+    comments, next_after = comment_page(post.pk, comments_after(request))
     return render(
         request,
         'post.html',
@@ -92,6 +143,51 @@ def post_view(request, username, post_id):
             'profile': post.author,
             'post': post,
             'form': form,
+            'comments': comments,
+            'next_after': next_after,
+            'reply_to': reply_to,
+        }
+    )
+
+
+@conditional_page(post_validators)
+def post_comments(request, username, post_id):
+    """Следующая страница комментариев поста или ветка комментария root:
+    HTML-фрагмент для подгрузки на странице поста, с format=json - JSON."""
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        author__username=username,
+        pk=post_id,
+    )
+    root_id = request.GET.get('root', '')
+    root = None
+    if root_id.isdigit():
+        root = get_object_or_404(Comment, post=post, pk=root_id)
+    comments, next_after = comment_page(
+        post.pk, comments_after(request), root)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'parent': comment.parent_id,
+                    'depth': comment.depth,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created,
+                }
+                for comment in comments
+            ],
+            'next': next_after,
+        }, json_dumps_params={'ensure_ascii': False})
+    return render(
+        request,
+        'parts/comment_items.html',
+        {
+            'post': post,
+            'comments': comments,
+            'next_after': next_after,
+            'root': root,
         }
     )
 
@@ -107,7 +203,15 @@ def post_edit(request, username, post_id):
         instance=post,
     )
     if form.is_valid():
-        form.save()
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            form.instance.image_processing = bool(form.instance.image)
+        post = form.save()
+        if image_changed and post.image:
+            enqueue('process_post_image', post_id=post.pk)
+        elif image_changed:
+            generate_thumbnail(post)
+            generate_variants(post)
         return redirect('post', username=username, post_id=post_id)
     return render(
         request,
@@ -124,9 +228,7 @@ def add_comment(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        form.instance.author = request.user
-        form.instance.post = post
-        form.save()
+        save_comment(request, form, post)
     return redirect('post', username=username, post_id=post_id)
 
 
@@ -143,12 +245,17 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+def follow_validators(request):
+    # Новые посты и комментарии меняют версию общей ленты, подписки и
+    # отписки - версию области самого пользователя.
+    return feed_validators(
+        request, 'index', f'author:{request.user.username}')
+
+
 @login_required
+@conditional_page(follow_validators)
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, TimelinePaginator(request.user))
     return render(
         request,
         'follow.html',
@@ -160,7 +267,7 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        write_buffer.save(Follow(user=request.user, author=author))
     return redirect('profile', username=username)
 
 
@@ -170,3 +277,20 @@ def profile_unfollow(request, username):
         user=request.user, author__username=username)
     follow.delete()
     return redirect('profile', username=username)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        hits, next_cursor = search_posts(query, request.GET.get('after'))
+    except InvalidCursor:
+        hits, next_cursor = search_posts(query)
+    return render(
+        request,
+        'search.html',
+        {
+            'query': query,
+            'hits': hits,
+            'next_cursor': next_cursor,
+        }
+    )
@@ -0,0 +1,190 @@
+"""Групповая запись комментариев и подписок.
+
+Когда WRITE_BUFFER_DELAY_MS не None, save() не пишет строку сам, а
+ставит её в общую очередь процесса. Первый запрос, заставший очередь
+пустой, ждёт WRITE_BUFFER_DELAY_MS и записывает всё, что накопилось,
+одним bulk_create в одной транзакции; остальные ждут, пока их пачка
+зафиксирована. save() возвращается только после COMMIT, поэтому ответ
+не уходит раньше, чем запись оказалась в базе, и при падении процесса
+теряются только запросы, которые ещё не получили ответа.
+
+Сигналы post_save отправляются для каждой созданной строки, как при
+обычном save(): счётчики, ленты, поиск и кэш обновляются так же.
+Если пачка не записалась, строки записываются по одной, и ошибку
+получает только тот запрос, чья строка её вызвала.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_save
+
+from .models import Comment, Follow, Post
+
+# Пар в одном запросе проверки подписок: SQLite разбирает цепочку OR
+# в дерево глубиной в число пар и не принимает деревья глубже 1000.
+FOLLOW_LOOKUP_CHUNK = 100
+
+
+class Entry:
+    def __init__(self, instance, using):
+        self.instance = instance
+        self.using = using
+        self.error = None
+        self.done = threading.Event()
+
+
+def mark_saved(instances, using):
+    """bulk_create в SQLite не отмечает строки без pk сохранёнными:
+    без этого save() на них снова сделал бы INSERT."""
+    for instance in instances:
+        instance._state.adding = False
+        instance._state.db = using
+
+
+def insert_comments(comments, using):
+    for comment in comments:
+        comment.limit_depth()
+    manager = Comment.objects.db_manager(using)
+    # Транзакция уже держит блокировку записи, так что новые id идут
+    # подряд после last.
+    last = manager.aggregate(last=Max('pk'))['last'] or 0
+    manager.bulk_create(comments)
+    if any(comment.pk is None for comment in comments):
+        pks = manager.filter(pk__gt=last).order_by('pk').values_list(
+            'pk', flat=True)
+        for comment, pk in zip(comments, pks):
+            comment.pk = pk
+    mark_saved(comments, using)
+    for comment in comments:
+        comment.path = comment.make_path()
+    manager.bulk_update(comments, ['path'])
+    # Сигналам нужны посты с авторами и группами: одним запросом
+    # на пачку, а не на каждый комментарий.
+    posts = Post.objects.db_manager(using).select_related(
+        'author', 'group').in_bulk({comment.post_id for comment in comments})
+    for comment in comments:
+        comment.post = posts[comment.post_id]
+    return comments
+
+
+def insert_follows(follows, using):
+    """Как get_or_create: уже существующие подписки и повторы внутри
+    пачки не вставляются."""
+    manager = Follow.objects.db_manager(using)
+    pairs = {}
+    for follow in follows:
+        pairs.setdefault((follow.user_id, follow.author_id), follow)
+    keys = list(pairs)
+    existing = set()
+    for start in range(0, len(keys), FOLLOW_LOOKUP_CHUNK):
+        condition = Q()
+        for user_id, author_id in keys[start:start + FOLLOW_LOOKUP_CHUNK]:
+            condition |= Q(user_id=user_id, author_id=author_id)
+        existing.update(manager.filter(condition).values_list(
+            'user_id', 'author_id'))
+    created = [
+        follow for pair, follow in pairs.items() if pair not in existing]
+    manager.bulk_create(created)
+    mark_saved(created, using)
+    return created
+
+
+INSERTERS = {
+    Comment: insert_comments,
+    Follow: insert_follows,
+}
+
+
+def save_one(instance, using):
+    if isinstance(instance, Follow):
+        instance, _ = Follow.objects.db_manager(using).get_or_create(
+            user_id=instance.user_id, author_id=instance.author_id)
+        return instance
+    instance.save(using=using)
+    return instance
+
+
+def reset(instance):
+    """Возвращает строку из откаченной пачки в состояние до вставки."""
+    instance.pk = None
+    instance._state.adding = True
+    if isinstance(instance, Comment):
+        instance.path = ''
+
+
+def write(entries, using):
+    models = {}
+    for entry in entries:
+        models.setdefault(type(entry.instance), []).append(entry.instance)
+    with transaction.atomic(using=using):
+        for model, instances in models.items():
+            for instance in INSERTERS[model](instances, using):
+                post_save.send(
+                    sender=model, instance=instance, created=True,
+                    update_fields=None, raw=False, using=using)
+
+
+def write_one_by_one(entries):
+    for entry in entries:
+        reset(entry.instance)
+        try:
+            with transaction.atomic(using=entry.using):
+                entry.instance = save_one(entry.instance, entry.using)
+        except Exception as error:
+            entry.error = error
+
+
+class WriteBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Пачки пишутся по одной: следующая копится, пока пишется
+        # предыдущая.
+        self.flushing = threading.Lock()
+        self.pending = []
+        self.collecting = False
+
+    def save(self, instance):
+        """Сохраняет Comment или Follow и возвращает сохранённую
+        строку; подписка, которая уже есть, не создаётся."""
+        using = router.db_for_write(type(instance), instance=instance)
+        delay = settings.WRITE_BUFFER_DELAY_MS
+        # Внутри чужой транзакции строка должна попасть в неё же.
+        if delay is None or connections[using].in_atomic_block:
+            return save_one(instance, using)
+        entry = Entry(instance, using)
+        with self.lock:
+            self.pending.append(entry)
+            leader = not self.collecting
+            self.collecting = True
+        if leader:
+            time.sleep(delay / 1000)
+            with self.flushing:
+                with self.lock:
+                    batch, self.pending = self.pending, []
+                    self.collecting = False
+                self.flush(batch)
+        entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.instance
+
+    def flush(self, batch):
+        databases = {}
+        for entry in batch:
+            databases.setdefault(entry.using, []).append(entry)
+        try:
+            for using, entries in databases.items():
+                try:
+                    write(entries, using)
+                except Exception:
+                    write_one_by_one(entries)
+        finally:
+            for entry in batch:
+                entry.done.set()
+
+
+buffer = WriteBuffer()
+save = buffer.save
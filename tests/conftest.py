@@ -1,4 +1,22 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_cache(tmp_path_factory):
+    # Файловый кэш - во временном каталоге, а не в cache/ проекта.
+    from yatube.test_runner import temporary_caches
+    with temporary_caches(str(tmp_path_factory.mktemp('cache'))):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(temporary_cache):
+    # Кэш общий на весь прогон: страницы одного теста не должны
+    # попадать в другой.
+    from django.core.cache import cache
+    cache.clear()
@@ -0,0 +1,199 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    # Итоги по таблице ведут триггеры, чтобы проверка лимитов
+    # не сканировала кэш целиком при каждой записи.
+    'CREATE TABLE IF NOT EXISTS totals ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+    ' entries INTEGER NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ')',
+    'INSERT OR IGNORE INTO totals VALUES (0, 0, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE totals SET entries = entries + 1, size = size + new.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE totals SET entries = entries - 1, size = size - old.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache'
+    ' BEGIN'
+    ' UPDATE totals SET size = size - old.size + new.size;'
+    ' END',
+)
+
+# Время последнего обращения обновляется не чаще раза в секунду на ключ:
+# для LRU этого достаточно, а чтения почти не превращаются в записи.
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+    LOCATION - путь к файлу базы. Кроме стандартных MAX_ENTRIES
+    и CULL_FREQUENCY, в OPTIONS понимается MAX_SIZE - предельный
+    суммарный размер значений в байтах. При превышении любого
+    из лимитов сначала удаляются просроченные записи, затем
+    давно не читавшиеся.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение SQLite нельзя переносить между потоками
+        # и через fork, поэтому оно своё у каждой пары процесс-поток.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _write(self, key, value, timeout, only_new):
+        data = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            if only_new:
+                row = db.execute(
+                    'SELECT expires FROM cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and (row[0] is None or row[0] > now):
+                    return False
+            # UPSERT, а не INSERT OR REPLACE: при REPLACE не срабатывает
+            # триггер удаления, и итоги в totals разошлись бы с таблицей.
+            db.execute(
+                'INSERT INTO cache VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET value = excluded.value,'
+                ' expires = excluded.expires, accessed = excluded.accessed,'
+                ' size = excluded.size',
+                (key, data, expires, now, len(data)),
+            )
+            self._cull(db, now)
+        return True
+
+    def _cull(self, db, now):
+        entries, size = db.execute(
+            'SELECT entries, size FROM totals').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,),
+        )
+        entries, size = db.execute(
+            'SELECT entries, size FROM totals').fetchone()
+        while entries > self._max_entries or size > self._max_size:
+            if self._cull_frequency == 0:
+                db.execute('DELETE FROM cache')
+                return
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(1, entries // self._cull_frequency),),
+            )
+            entries, size = db.execute(
+                'SELECT entries, size FROM totals').fetchone()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._write(key, value, timeout, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(key, value, timeout, only_new=False)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        db = self._db
+        row = db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            return default
+        data, expires, accessed = row
+        if expires is not None and expires <= now:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            return default
+        if now - accessed > ACCESS_RESOLUTION:
+            db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(data)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт столько же, сколько поток: открывать файл
+        # заново на каждый запрос дороже, чем держать его открытым.
+        pass
@@ -0,0 +1,199 @@
+"""Число запросов к базе, время базы, шаблонов и всего ответа по
+именам адресов - в гистограммах в памяти процесса.
+
+Замеряется только доля запросов METRICS_SAMPLE_RATE, остальные
+проходят без обёрток. Отчёт - /admin/metrics/, только для персонала;
+у каждого процесса сервера свои гистограммы.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (DjangoTemplates, Template,
+                                             reraise)
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+# Верхние границы корзин; последняя корзина - всё, что больше.
+TIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+METRICS = {
+    'queries': COUNT_BUCKETS,
+    'db_ms': TIME_BUCKETS,
+    'template_ms': TIME_BUCKETS,
+    'total_ms': TIME_BUCKETS,
+}
+PERCENTILES = (50, 90, 99)
+UNRESOLVED = '<unresolved>'
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, share):
+        """Верхняя граница корзины, в которую попал перцентиль;
+        для последней корзины - наибольшее значение."""
+        rank = share / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                break
+        return self.max
+
+    def summary(self):
+        summary = {
+            f'p{share}': round(self.percentile(share), 2)
+            for share in PERCENTILES
+        }
+        summary['mean'] = round(self.total / self.count, 2)
+        summary['max'] = round(self.max, 2)
+        summary['buckets'] = dict(zip(
+            [str(bound) for bound in self.bounds] + ['inf'], self.counts))
+        return summary
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.since = timezone.now()
+
+    def record(self, name, **values):
+        with self.lock:
+            histograms = self.views.get(name)
+            if histograms is None:
+                histograms = self.views[name] = {
+                    metric: Histogram(bounds)
+                    for metric, bounds in METRICS.items()
+                }
+            for metric, value in values.items():
+                histograms[metric].add(value)
+
+    def report(self):
+        with self.lock:
+            return {
+                name: {
+                    'count': histograms['total_ms'].count,
+                    **{metric: histogram.summary()
+                       for metric, histogram in histograms.items()},
+                }
+                for name, histograms in sorted(self.views.items())
+            }
+
+
+registry = Registry()
+active = threading.local()
+
+
+class Sample:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        sample = getattr(active, 'sample', None)
+        if sample is None:
+            return super().render(context, request)
+        # Шаблон, отрендеренный из другого, считается только внешним.
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_depth -= 1
+            if not sample.template_depth:
+                sample.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, который записывает время рендера
+    в замер текущего запроса. Шаблоны Django не сообщают о рендере
+    вне тестов; без замера обёртка стоит одного getattr."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        sample = active.sample = Sample()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample))
+                response = self.get_response(request)
+        finally:
+            del active.sample
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        registry.record(
+            match.view_name if match else UNRESOLVED,
+            queries=sample.queries,
+            db_ms=sample.db_time * 1000,
+            template_ms=sample.template_time * 1000,
+            total_ms=total * 1000,
+        )
+        return response
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def report(request):
+    """GET - гистограммы по адресам, POST - сбросить их."""
+    if request.method == 'POST':
+        registry.reset()
+    return JsonResponse({
+        'sample_rate': settings.METRICS_SAMPLE_RATE,
+        'since': registry.since,
+        'views': registry.report(),
+    }, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,130 @@
+"""Чтение страниц лент из копии базы.
+
+Копия - файл REPLICA_PATH, который manage.py refresh_replica
+периодически снимает с основной базы через online backup API SQLite.
+Время изменения файла - момент, с которого снят снимок: всё, что
+записано раньше, в нём есть.
+
+ReplicaMiddleware отправляет чтения GET-запросов к страницам из
+REPLICA_VIEWS в копию, если она не старше:
+
+- последней записи этого посетителя - время записи хранится в cookie,
+  поэтому автор сразу видит свою запись или комментарий;
+- версии ленты, которую страница кладёт в кэш (см. require), иначе
+  устаревшая страница закэшировалась бы под новой версией.
+
+Все записи и остальные чтения идут в основную базу.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+COOKIE = 'wrote_at'
+COOKIE_AGE = 60 * 60 * 24
+SAFE_METHODS = ('GET', 'HEAD')
+
+state = threading.local()
+
+
+def snapshot_time():
+    """Момент снимка копии или None, если копии нет."""
+    try:
+        return os.stat(settings.REPLICA_PATH).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh(source=None, target=None):
+    """Снимает копию source в target и возвращает момент снимка."""
+    source = source or connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    target = target or settings.REPLICA_PATH
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    started = time.time()
+    partial = target + '.partial'
+    with closing(sqlite3.connect(source)) as origin, \
+            closing(sqlite3.connect(partial)) as copy:
+        origin.backup(copy)
+        # Копия открывается только на чтение, а WAL требует записи
+        # в файл -shm.
+        copy.execute('PRAGMA journal_mode = DELETE')
+    os.utime(partial, (started, started))
+    # Открытые соединения дочитывают старый файл, новые откроют этот.
+    os.replace(partial, target)
+    return started
+
+
+def require(moment):
+    """Читать из копии в этом запросе, только если она не старше
+    moment."""
+    state.required = max(getattr(state, 'required', 0), moment)
+
+
+def written_at(request):
+    try:
+        return float(request.COOKIES.get(COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        snapshot = getattr(state, 'snapshot', None)
+        if snapshot is not None and snapshot >= getattr(state, 'required', 0):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        state.wrote = True
+        # Объект, прочитанный из копии, иначе сохранялся бы туда же.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.__dict__.clear()
+        try:
+            response = self.get_response(request)
+            if getattr(state, 'wrote', False):
+                response.set_cookie(
+                    COOKIE, f'{time.time():.6f}', max_age=COOKIE_AGE,
+                    httponly=True, samesite='Lax',
+                )
+            return response
+        finally:
+            state.__dict__.clear()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method not in SAFE_METHODS
+                or request.resolver_match.view_name
+                not in settings.REPLICA_VIEWS):
+            return None
+        replica = connections[REPLICA]
+        # Зеркало основной базы (TEST MIRROR в тестах) - не копия.
+        if (replica.settings_dict['NAME']
+                == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']):
+            return None
+        snapshot = snapshot_time()
+        if snapshot is None:
+            return None
+        # Соединение, открытое до обновления файла, видит старый снимок.
+        if getattr(replica, 'snapshot', None) != snapshot:
+            replica.close()
+            replica.snapshot = snapshot
+        state.snapshot = snapshot
+        require(written_at(request))
+        return None
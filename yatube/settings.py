@@ -33,17 +33,22 @@ INSTALLED_APPS = [
     'sorl.thumbnail',
     'debug_toolbar',
     'rest_framework.authtoken',
+    'api',
 ]
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'yatube.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -52,7 +57,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, который сообщает время рендера в yatube.metrics.
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,13 +75,34 @@ TEMPLATES = [
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
+# Копия базы для чтения лент, её обновляет manage.py refresh_replica.
+REPLICA_PATH = os.path.join(BASE_DIR, 'replica', 'db.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # WAL, PRAGMA и BEGIN IMMEDIATE - см. yatube/sqlite/base.py.
+        'ENGINE': 'yatube.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение с его PRAGMA и кэшем страниц живёт между запросами
+        # в своём потоке.
+        'CONN_MAX_AGE': 60,
+    },
+    'replica': {
+        'ENGINE': 'yatube.sqlite',
+        'NAME': f'file:{REPLICA_PATH}?mode=ro',
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            # Копия только читается: журнал WAL и блокировка записи
+            # в начале транзакции ей не нужны.
+            'pragmas': {'journal_mode': None},
+            'transaction_mode': None,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['yatube.replicas.ReplicaRouter']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -133,9 +160,59 @@ SITE_ID = 1
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     },
     'testing': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     },
 }
+
+# manage.py test держит кэш во временном каталоге.
+TEST_RUNNER = 'yatube.test_runner.TemporaryCacheRunner'
+
+# Авторы, у которых подписчиков или записей больше этих порогов,
+# не раскладывают записи по лентам подписчиков при публикации:
+# их записи подмешиваются в ленту при чтении.
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+
+TIMELINE_FANOUT_MAX_POSTS = 5000
+
+# Страницы лент сбрасываются сигналами при изменении записей,
+# поэтому их можно хранить долго.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+FEED_CACHE_LOCK_TIMEOUT = 10
+
+# Очередь фоновых задач (manage.py run_jobs).
+JOB_LOCK_TIMEOUT = 5 * 60
+
+JOB_RETRY_DELAY = 10
+
+# Куда manage.py bench_views сохраняет результаты замеров.
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+
+# Доля запросов, для которых MetricsMiddleware считает запросы к базе
+# и время ответа; 0 - не замерять.
+METRICS_SAMPLE_RATE = 0.1
+
+# Запросы к базе дольше порога попадают в журнал медленных запросов
+# (yatube.slow_queries); None - не засекать.
+SLOW_QUERY_THRESHOLD_MS = 100
+
+SLOW_QUERY_LOG_SIZE = 200
+
+# Страницы, которые читают из копии базы (yatube.replicas), и как часто
+# manage.py refresh_replica снимает копию, в секундах.
+REPLICA_VIEWS = ('index', 'group', 'profile', 'post')
+
+REPLICA_REFRESH_INTERVAL = 30
+
+# Окно, за которое комментарии и подписки из разных запросов
+# собираются в одну транзакцию (posts.write_buffer); None - писать
+# каждую строку сразу.
+WRITE_BUFFER_DELAY_MS = None
@@ -0,0 +1,229 @@
+"""Журнал медленных запросов к базе.
+
+SlowQueryMiddleware ставит на время запроса execute_wrapper на все
+соединения и засекает каждый запрос к базе. Запросы дольше
+SLOW_QUERY_THRESHOLD_MS пишутся в лог yatube.slow_queries вместе с вью,
+строкой кода и шаблоном, из которых они выполнены, и собираются по
+отпечатку - тексту SQL без значений. У отпечатка один раз снимается
+план выполнения. Сводка - /admin/slow-queries/, только для персонала.
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template.base import Template
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+logger = logging.getLogger(__name__)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%s')
+VALUES_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+EXPLAINABLE = ('SELECT', 'WITH')
+SITE_PACKAGES = ('site-packages', 'dist-packages')
+# Middleware и обёртки из yatube/ - не место вызова.
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalize(sql):
+    """SQL без конкретных значений: IN (1, 2, 3) и IN (4, 5) дают
+    одну строку."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    sql = VALUES_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:16]
+
+
+def explain(connection, sql, params):
+    """План запроса строками с отступами по вложенности."""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = cursor.fetchall()
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        return lines
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN ' + sql, params)
+        return [' '.join(map(str, row)) for row in cursor.fetchall()]
+
+
+def caller():
+    """Первая строка кода проекта в стеке и шаблон, который
+    рендерился в момент запроса."""
+    location = template = None
+    frame = sys._getframe(2)
+    while frame is not None and (location is None or template is None):
+        code = frame.f_code
+        if template is None and code is Template._render.__code__:
+            origin = frame.f_locals['self'].origin
+            template = origin.template_name or origin.name
+        filename = code.co_filename
+        if (location is None
+                and filename.startswith(settings.BASE_DIR)
+                and not any(part in filename for part in SITE_PACKAGES)
+                and not filename.startswith(PACKAGE_DIR)):
+            location = (
+                f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                f'{frame.f_lineno} {code.co_name}'
+            )
+        frame = frame.f_back
+    return location, template
+
+
+class Log:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+            self.dropped = 0
+            self.since = timezone.now()
+
+    def add(self, key, sql, duration, view, location, template):
+        """Возвращает запись отпечатка или None, если журнал полон.
+        Второй элемент - новый ли это отпечаток."""
+        with self.lock:
+            entry = self.entries.get(key)
+            created = entry is None
+            if created:
+                if len(self.entries) >= settings.SLOW_QUERY_LOG_SIZE:
+                    self.dropped += 1
+                    return None, False
+                entry = self.entries[key] = {
+                    'sql': normalize(sql),
+                    'example': sql,
+                    'count': 0,
+                    'total_ms': 0,
+                    'max_ms': 0,
+                    'views': Counter(),
+                    'locations': Counter(),
+                    'templates': Counter(),
+                    'plan': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration
+            entry['max_ms'] = max(entry['max_ms'], duration)
+            entry['views'][view] += 1
+            entry['locations'][location] += 1
+            if template is not None:
+                entry['templates'][template] += 1
+            return entry, created
+
+    def report(self):
+        with self.lock:
+            entries = sorted(
+                self.entries.items(),
+                key=lambda item: item[1]['total_ms'], reverse=True)
+            return [
+                {
+                    'fingerprint': key,
+                    **entry,
+                    'total_ms': round(entry['total_ms'], 2),
+                    'max_ms': round(entry['max_ms'], 2),
+                    'views': dict(entry['views'].most_common()),
+                    'locations': dict(entry['locations'].most_common()),
+                    'templates': dict(entry['templates'].most_common()),
+                }
+                for key, entry in entries
+            ]
+
+
+log = Log()
+state = threading.local()
+
+
+class Recorder:
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else self.request.path
+
+    def __call__(self, execute, sql, params, many, context):
+        # Запросы EXPLAIN идут через те же обёртки.
+        if getattr(state, 'explaining', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= self.threshold:
+                self.record(sql, params, many, duration,
+                            context['connection'])
+
+    def record(self, sql, params, many, duration, connection):
+        location, template = caller()
+        view = self.view()
+        entry, created = log.add(
+            fingerprint(sql), sql, duration, view, location, template)
+        logger.warning(
+            'Медленный запрос %.1f мс, %s, %s%s: %s',
+            duration, view, location,
+            f', шаблон {template}' if template else '', sql,
+        )
+        if created and not many:
+            state.explaining = True
+            try:
+                entry['plan'] = explain(connection, sql, params)
+            except Exception:
+                logger.exception('Не удалось получить план запроса')
+            finally:
+                state.explaining = False
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold is None:
+            return self.get_response(request)
+        recorder = Recorder(request, threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def report(request):
+    """GET - отпечатки по суммарному времени, POST - очистить журнал."""
+    if request.method == 'POST':
+        log.reset()
+    return JsonResponse({
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+        'since': log.since,
+        'dropped': log.dropped,
+        'queries': log.report(),
+    }, json_dumps_params={'ensure_ascii': False})
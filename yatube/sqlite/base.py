@@ -0,0 +1,70 @@
+"""Бэкенд SQLite с настройками для нескольких потоков и процессов.
+
+Отличается от django.db.backends.sqlite3 двумя вещами.
+
+PRAGMA выполняются при открытии каждого соединения. Журнал WAL не
+мешает читателям во время записи, а synchronous=NORMAL в режиме WAL
+сбрасывает данные на диск только при контрольной точке. busy_timeout
+задаёт, сколько ждать блокировки, прежде чем отдать "database is
+locked". cache_size и mmap_size действуют, пока соединение открыто,
+поэтому бэкенд стоит держать с CONN_MAX_AGE.
+
+Транзакции atomic() открываются через BEGIN IMMEDIATE. После BEGIN
+DEFERRED транзакция, которая сначала читает, а потом пишет, не
+дожидается блокировки: SQLite сразу отвечает "database is locked".
+
+OPTIONS в DATABASES понимает ещё два ключа. pragmas дополняет или
+заменяет PRAGMAS; значение None отменяет PRAGMA. transaction_mode
+задаёт режим BEGIN, None - режим SQLite по умолчанию.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательный размер - в килобайтах: 64 МБ на соединение.
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODE = 'IMMEDIATE'
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Остальные ключи OPTIONS уходят в sqlite3.connect.
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    @property
+    def pragmas(self):
+        pragmas = {
+            **PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        return {
+            name: value for name, value in pragmas.items()
+            if value is not None
+        }
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get(
+            'transaction_mode', TRANSACTION_MODE)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}')
+        return mode
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.transaction_mode
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,35 @@
+"""Тесты пишут кэш во временный каталог, а не в cache/ проекта:
+прогон не затирает кэш разработчика, и страницы, закэшированные
+вне тестов, не попадают в тесты."""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def temporary_caches(directory):
+    """override_settings, который переносит файловые кэши в directory."""
+    caches = {}
+    for alias, options in settings.CACHES.items():
+        if options['BACKEND'] == 'yatube.cache.SQLiteCache':
+            options = {
+                **options,
+                'LOCATION': os.path.join(directory, f'{alias}.sqlite3'),
+            }
+        caches[alias] = options
+    return override_settings(CACHES=caches)
+
+
+class TemporaryCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.caches = temporary_caches(self.cache_directory.name)
+        self.caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches.disable()
+        self.cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -9,12 +9,16 @@ from rest_framework.authtoken import views as rest_views
 
 from posts import views as posts_views
 
+from . import metrics, slow_queries
+
 handler404 = 'posts.views.page_not_found'  # noqa
 handler500 = 'posts.views.server_error'  # noqa
 
 urlpatterns = [
     path('404/', posts_views.page_not_found),
     path('500/', posts_views.server_error),
+    path('admin/metrics/', metrics.report, name='metrics'),
+    path('admin/slow-queries/', slow_queries.report, name='slow_queries'),
     path('admin/', admin.site.urls),
     path('about/', include('django.contrib.flatpages.urls')),
     path('auth/', include('users.urls')),
@@ -30,7 +34,8 @@ urlpatterns += [
 ]
 
 urlpatterns += [
-    path('api-token-auth/', rest_views.obtain_auth_token)
+    path('api-token-auth/', rest_views.obtain_auth_token),
+    path('api/', include('api.urls')),
 ]
 
 if settings.DEBUG: